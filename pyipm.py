@@ -2,17 +2,10 @@ from __future__ import print_function
 
 import aesara
 import aesara.tensor as aet
+from aesara.compile.sharedvalue import SharedVariable
+from aesara.graph.basic import graph_inputs
 import numpy as np
-from aesara.tensor.nlinalg import pinv
-from aesara.tensor.basic import diag
-from aesara.tensor.nlinalg import eigh
-from aesara.tensor.slinalg import eigvalsh
-from aesara.ifelse import ifelse
-
-try:
-    FunctionType = aesara.compile.function_module.Function
-except AttributeError:
-    FunctionType = aesara.compile.function.types.Function
+import scipy.linalg
 
 
 class IPM:
@@ -51,6 +44,7 @@ class IPM:
              SciPy
              aesara
            Optional:
+             JAX (only for the jax_functions class function)
              Intel MKL, OpenBlas, ATLAS, or BLAS/LAPACK
              Nvidia's CUDA or OpenCL
                for more details on support for GPU software, see the aesara
@@ -67,7 +61,8 @@ class IPM:
                python pyipm.py 3
 
            and the solver will print the solution to screen. There are 10 example
-           problems that are called by numbers on the range 1 through 10.
+           problems that are called by numbers on the range 1 through 10. Several
+           problems may be run in parallel in one call, e.g. 'python pyipm.py 1 3 5'.
 
 
        Input types:
@@ -108,14 +103,16 @@ class IPM:
                  of the equality constraints wrt x_dev.
                [Args] x_dev
                [Default] if ce is not None, then dce is assigned through automatic
-                 symbolic differentiation of ce wrt x_dev; otherwise None.
+                 symbolic differentiation of ce wrt x_dev (or, if ce is a function,
+                 approximated by forward differences); otherwise None.
                [Returns] symbolic array (size DxM)
                [NOTE] see notes 1) and 2) below.
            d2ce (aesara expression, OPTIONAL): symbolic expression for the Hessian
                  of the equality constraints wrt x_dev and lambda_dev (see below).
                [Args] x_dev, lambda_dev
                [Default] if ce is not None, then d2ce is assigned through automatic
-                 symbolic differentiation of ce wrt x_dev; otherwise None.
+                 symbolic differentiation of ce wrt x_dev; otherwise None. If ce is
+                 a function, d2ce is required unless L-BFGS is used.
                [Returns] symbolic array (size DxD)
                [NOTE] see notes 1) and 3) below.
            ci (aesara expression, OPTIONAL): symbolic expression for the
@@ -129,14 +126,16 @@ class IPM:
                  of the inequality constraints wrt x_dev.
                [Args] x_dev
                [Default] if ci is not None, then dci is assigned through automatic
-                 symbolic differentiation of ci wrt x_dev; otherwise None
+                 symbolic differentiation of ci wrt x_dev (or, if ci is a function,
+                 approximated by forward differences); otherwise None
                [Returns] symbolic array (size DxN)
                [NOTE] see notes 1) and 2) below.
            d2ci (aesara expression, OPTIONAL): symbolic expression for the Hessian
                  of the inequality constraints wrt x_dev and lambda_dev (see below).
                [Args] x_dev, lambda_dev
                [Default] if ci is not None, then d2ci is assigned through autormatic
-                 symbolic differentiation of ci wrt x_dev; otherwise None
+                 symbolic differentiation of ci wrt x_dev; otherwise None. If ci is
+                 a function, d2ci is required unless L-BFGS is used.
                [Returns] symbolic array (size DxD)
                [NOTE] see notes 1) and 3) below.
            lda0 (NumPy array, OPTIONAL): Lagrange multiplier initialization (size
@@ -144,7 +143,7 @@ class IPM:
                  for inequality constraints all elements of lda0[M:] must be >=0.
                [Default] if ce or ci is not None, then lda0 is initialized using dce
                  (if ce is not None), dci (if ci is not None), and df all evaluated
-                 at x0 and the Moore-Penrose pseudoinverse; otherwise None
+                 at x0 and the minimum-norm least-squares solution; otherwise None
            lambda_dev (aesara expression, OPTIONAL) symbolic Lagrange multipliers.
                  This only required if you supply your own input for d2ce or d2ci.
                [Default] None
@@ -175,8 +174,9 @@ class IPM:
            niter (int, OPTIONAL): number of 'outer' iterations where mu is
                  adjusted.
                [Default] 10
-           Xtol (float, OPTIONAL): weight precision tolerance (used only in
-                 fraction-to-the-boundary rule).
+           Xtol (float, OPTIONAL): weight precision tolerance (retained for
+                 compatibility; the fraction-to-the-boundary rule is now solved
+                 in closed form and does not use it).
                [Default] np.finfo(float_dtype).eps (machine precision of
                  float_dtype; see below)
            Ktol (float, OPTIONAL): convergence tolerance on the Karush-Kuhn-
@@ -202,6 +202,12 @@ class IPM:
                [Default] np.float64 (64-bit floats)
                [NOTE] Using 32-bit precision is not recommended; the numerical
                  inaccuracy can lead to slow convergence.
+           mixed_precision (bool, OPTIONAL): if True, the aesara functions are
+                 still evaluated in float_dtype, but the Hessian (or its L-BFGS
+                 approximation) is assembled and the Newton system is solved in
+                 64-bit precision; the search direction is then cast back to
+                 float_dtype. This is intended for float_dtype=np.float32.
+               [Default] False
            verbosity (integer, OPTIONAL): screen output level from -1 to 3 where -1
                  is no feedback and 3 is maximum feedback.
                [Default] 1
@@ -213,6 +219,9 @@ class IPM:
            replacing f, ce, or ci with functions will disable automatic
            differentiation capabilities. This option is available for those who wish
            to avoid redefining aesara functions that have already been compiled.
+           Any Python callable taking the same arguments and returning NumPy arrays
+           is accepted, so e.g. NumPy or Numba-compiled functions may be used for
+           small problems where the overhead of calling aesara functions dominates.
            However, using symbolic expressions may lead to a quicker optimization.
 
            2) When defining your own Jacobians, dce and dci, keep in mind that dce and
@@ -227,22 +236,26 @@ class IPM:
 
 
        Class Functions:
-           compile(nvar=None, neq=None, nineq=None): validate input,
+           compile(nvar=None, neq=None, nineq=None, force=False): validate input,
                  form expressions for the Lagrangian and its gradient and Hessian,
                  form expressions for weight and Lagrange multiplier initialization,
                  define device variables, and compile symbolic expressions.
-               [Args] nvar (optional), neq (optional), nineq (optional)
+               [Args] nvar (optional), neq (optional), nineq (optional), force
+                  (optional)
                  * nvar (int, scalar) must be set to the number of weights if x0 is
                    uninitialized
                  * neq (int, scalar) must be set to the number of equality constraints
                    if x0 is unintialized, M
                  * nineq (int, scalar) must be set to the number of inequality
                    constraints if x0 is uninitialized, N (scalar)
-               [NOTE] If the user runs compile on an instance of the
-                 solver object and then intends to reuse the solver object after
-                 changing the symbolic aesara expressions defined in the Class
-                 Variables section, compile will need to be rerun to
-                 compile any modified/new expressions.
+                 * force (bool, scalar) recompile even if functions compiled for the
+                   same expressions, dimensions, and settings are available
+               [NOTE] Functions compiled for the same expressions, number of
+                 weights, and settings (lbfgs, Ktol, float_dtype, and
+                 mixed_precision) are kept on the solver object, so rerunning
+                 compile when nothing has changed reuses them instead of
+                 recompiling (unless force is set), while new expressions or
+                 settings are compiled anew.
            solve(x0=None, s0=None, lda0=None, force_recompile=False): run the interior
                  -point method solver.
                [Args] x0 (optional), s0 (optional), lda0 (optional),
@@ -254,9 +267,9 @@ class IPM:
                  * lda0 (NumPy array, size M+N) gives the user control over
                    initialization of the Lagrange multipliers, if desired
                  * force_recompile (bool, scalar) the solve() class function
-                   automatically calls the compile() class function on its first
-                   execution. On subsequent executions, solve() will not automatically
-                   recompile unless force_recompile is set to True.
+                   automatically calls the compile() class function, which reuses
+                   the functions compiled for unchanged expressions and settings
+                   unless force_recompile is set to True.
                [Returns] (x, s, lda, fval, kkt)
                  * x (NumPy array, size D) are the weights at the solution
                  * s (NumPy array, size N) are the slack variables at the solution
@@ -288,6 +301,21 @@ class IPM:
                [NOTE] All arguments are required. If s and/or lda are irrelevant to
                  the user's problem, set those variables to a 0 dimensional NumPy
                  array.
+           jax_functions(f, ce=None, ci=None, lbfgs=False): build f, ce, ci and
+                 their derivatives as functions (see note 1) from JAX-traceable
+                 Python functions using JAX's just-in-time compilation and
+                 automatic differentiation.
+               [Args] f, ce (optional), ci (optional), lbfgs (optional)
+                 * f (callable) maps the weights to the objective function
+                 * ce and ci (callable) map the weights to the equality and
+                   inequality constraints, respectively
+                 * lbfgs (bool or int) if set, the Hessians are omitted
+               [Returns] dictionary with the keys f, df, d2f, ce, dce, d2ce, ci, dci,
+                 and d2ci that may be passed to the IPM constructor as keyword
+                 arguments
+               [NOTE] JAX computes in 32-bit precision unless the 'jax_enable_x64'
+                 configuration option is set; with float_dtype=np.float64, the
+                 returned functions raise a ValueError unless it is set.
 
 
        References:
@@ -306,7 +334,7 @@ class IPM:
     def __init__(self, x0=None, x_dev=None, f=None, df=None, d2f=None, ce=None, dce=None, d2ce=None, ci=None, dci=None,
                  d2ci=None, lda0=None, lambda_dev=None, s0=None, mu=0.2, nu=10.0, rho=0.1, tau=0.995, eta=1.0E-4,
                  beta=0.4, miter=20, niter=10, Xtol=None, Ktol=1.0E-4, Ftol=None, lbfgs=False, lbfgs_zeta=None,
-                 float_dtype=np.float64, verbosity=1):
+                 float_dtype=np.float64, mixed_precision=False, verbosity=1):
 
         self.x0 = x0
         self.x_dev = x_dev
@@ -355,11 +383,13 @@ class IPM:
         self.lbfgs_fail_max = lbfgs
 
         self.float_dtype = float_dtype
+        # the Newton systems are assembled and solved on the host in solve_dtype
+        self.mixed_precision = mixed_precision
+        self.solve_dtype = np.float64 if mixed_precision else float_dtype
         self.nu_dev = aesara.shared(self.float_dtype(self.nu), name='nu_dev')
         self.mu_dev = aesara.shared(self.float_dtype(self.mu), name='mu_dev')
-        self.dz_dev = aet.vector('dz_dev')
-        self.b_dev = aet.matrix('b_dev')
-        self.M_dev = aet.matrix('M_dev')
+        if self.lambda_dev is None:
+            self.lambda_dev = aet.vector('lamda_dev')
         self.s_dev = aet.vector('s_dev')
 
         self.verbosity = verbosity
@@ -369,13 +399,127 @@ class IPM:
         self.numpy_printoptions = np.set_printoptions(precision=4)
 
         self.compiled = False
+        self.compile_cache = {}
 
     @staticmethod
     def check_precompile(func):
-        """Check if the aesara expression is actually a aesara function. If so,
-           return True, otherwise return False.
+        """Check if the aesara expression is actually a function (a compiled
+           aesara function or any other Python callable, e.g. a NumPy or
+           Numba-compiled function). If so, return True, otherwise return False.
+        """
+        return callable(func)
+
+    def function(self, inputs, outputs):
+        """Compile an aesara function. All solver functions are compiled with the
+           same options: inputs that an expression does not use are ignored,
+           inputs are downcast to the precision of the device variables without
+           raising an error, and, for the default virtual machine linker, the
+           intermediate results are kept allocated between calls since the
+           functions are called repeatedly with arrays of the same size.
         """
-        return isinstance(func, FunctionType)
+        mode = aesara.compile.mode.get_default_mode()
+        if getattr(mode.linker, 'allow_gc', False):
+            mode = mode.clone(link_kwargs={'allow_gc': False})
+        return aesara.function(inputs=inputs, outputs=outputs, mode=mode, on_unused_input='ignore',
+                               allow_input_downcast=True)
+
+    def x_function(self, expr):
+        """Compile the symbolic expression expr of x_dev into a function of the
+           weights. If the value of expr does not depend on x_dev (e.g. the
+           gradient of a linear objective or the Jacobian of linear constraints),
+           it is evaluated once and the function returns the same read-only array
+           on every call. Expressions that read shared variables are never folded
+           since their values may change between solves.
+        """
+        func = self.function(inputs=[self.x_dev], outputs=expr)
+        if any(isinstance(var, SharedVariable) for var in graph_inputs([expr])):
+            return func
+        try:
+            # expressions such as aet.grad(f, x_dev) refer to x_dev for its shape even if f is linear, so the
+            # dependence on its value is checked through the connection of the gradient instead
+            dexpr = aesara.grad(aet.sum(expr), self.x_dev, disconnected_inputs='ignore', return_disconnected='None')
+        except (NotImplementedError, aesara.gradient.NullTypeGradError):
+            dexpr = True
+        if dexpr is not None:
+            return func
+        const = np.asarray(func(np.zeros(self.nvar, dtype=self.float_dtype)), dtype=self.float_dtype)
+        const.setflags(write=False)
+        return lambda x: const
+
+    def fd_jacobian(self, func):
+        """Return a function that approximates the transposed Jacobian (size
+           DxM, see dce and dci) of the constraints function func by forward
+           differences. If func is vectorized, i.e. it maps a DxK matrix of
+           weights to the constraints of each column, the D perturbed points
+           are evaluated in a single call; otherwise they are evaluated one at
+           a time. Which of the two applies is determined on the first call by
+           comparing both for every column.
+        """
+        h0 = np.sqrt(self.eps)
+        state = {}
+
+        def jaco(x):
+            h = h0 * np.maximum(np.abs(x), 1.0)
+            X = x[:, None] + np.diag(h)
+            c = np.reshape(func(x), (-1, 1))
+            if state.get('vectorized', False):
+                C = np.reshape(func(X), (c.size, x.size))
+            else:
+                C = np.stack([np.reshape(func(X[:, i]), (-1,)) for i in range(x.size)], axis=1)
+            if 'vectorized' not in state:
+                # the differences are compared rather than the values, which only differ by about h
+                try:
+                    state['vectorized'] = np.allclose((np.reshape(func(X), C.shape) - c) / h, (C - c) / h)
+                except (ValueError, IndexError, TypeError):
+                    state['vectorized'] = False
+            return ((C - c) / h).T.astype(self.float_dtype)
+
+        return jaco
+
+    @staticmethod
+    def jax_functions(f, ce=None, ci=None, lbfgs=False):
+        """Return f, ce, ci, and their derivatives as NumPy functions compiled
+           by JAX (see jax_functions in the class docstring). The Jacobians are
+           transposed to size DxM and DxN, and the constraint Hessians are
+           weighted by the corresponding part of the Lagrange multipliers. The
+           functions raise a ValueError if they are called with 64-bit weights
+           while JAX computes in 32-bit precision.
+        """
+        import jax
+        import jax.numpy as jnp
+
+        def wrap(func):
+            func = jax.jit(func)
+
+            def call(*args):
+                # JAX would silently compute in 32-bit precision, which the cast below would hide
+                if args[0].dtype == np.float64 and not jax.config.jax_enable_x64:
+                    raise ValueError('64-bit weights require the JAX configuration option jax_enable_x64 (e.g. '
+                                     'jax.config.update(\'jax_enable_x64\', True)).')
+                return np.asarray(func(*args), dtype=args[0].dtype)
+
+            return call
+
+        def lagrangian_hessian(con, part):
+            hess = jax.hessian(lambda x, lda: jnp.dot(jnp.atleast_1d(con(x)), lda))
+
+            def d2c(x, lda):
+                # the number of constraints is static while tracing, so it selects their multipliers
+                size = jax.eval_shape(con, x).size
+                return hess(x, lda[:size] if part == 'eq' else lda[lda.size - size:])
+
+            return d2c
+
+        funcs = {'f': wrap(f), 'df': wrap(jax.grad(f)), 'd2f': None if lbfgs else wrap(jax.hessian(f))}
+        for name, part, con in (('ce', 'eq', ce), ('ci', 'ineq', ci)):
+            if con is None:
+                funcs.update({name: None, 'd' + name: None, 'd2' + name: None})
+                continue
+            funcs[name] = wrap(con)
+            funcs['d' + name] = wrap(lambda x, con=con: jax.jacrev(lambda y: jnp.atleast_1d(con(y)))(x).T)
+            funcs['d2' + name] = None if lbfgs else wrap(lagrangian_hessian(con, part))
+
+        return funcs
 
     def validate(self):
         """Validate inputs
@@ -384,6 +528,12 @@ class IPM:
         assert self.f is not None
         assert (self.ce is not None) or (self.ce is None and self.dce is None and self.d2ce is None)
         assert (self.ci is not None) or (self.ci is None and self.dci is None and self.d2ci is None)
+        if not self.lbfgs:
+            # functions cannot be differentiated symbolically and only their Jacobians are approximated numerically
+            for name in ('ce', 'ci'):
+                if self.check_precompile(getattr(self, name)) and getattr(self, 'd2' + name) is None:
+                    raise ValueError('d2{0} is required when {0} is a function and the exact Hessian is used (set '
+                                     'lbfgs to use an approximate Hessian instead).'.format(name))
         assert self.mu > 0.0
         assert self.nu > 0.0
         assert 0.0 < self.eta < 1.0
@@ -400,10 +550,27 @@ class IPM:
             assert isinstance(self.lbfgs, int)
         assert self.lbfgs_zeta is None or self.lbfgs_zeta > 0.0
 
-    def compile(self, nvar=None, neq=None, nineq=None):
+    def compile(self, nvar=None, neq=None, nineq=None, force=False):
         """Validate some of the input variables and compile the objective function,
            the gradient, and the Hessian with constraints.
         """
+        # mixed_precision, like lbfgs and Ktol, may be changed between solves
+        self.solve_dtype = np.float64 if self.mixed_precision else self.float_dtype
+
+        # reuse the functions compiled by an earlier call if the expressions, number of weights, and settings they
+        # were compiled for are unchanged, unless a recompile is forced (the expressions themselves are part of the
+        # cached entry so that their ids cannot be reused while the entry exists); the numbers of constraints follow
+        # from the expressions and are restored from the cached entry
+        exprs = (self.x_dev, self.lambda_dev, self.f, self.df, self.d2f, self.ce, self.dce, self.d2ce, self.ci,
+                 self.dci, self.d2ci)
+        sig = (nvar if nvar is not None else self.nvar, self.lbfgs, self.Ktol, self.float_dtype,
+               self.solve_dtype, tuple(id(expr) for expr in exprs))
+        if not force and sig in self.compile_cache:
+            self.__dict__.update(self.compile_cache[sig][1])
+            self.jaco_factor_cache = None
+            self.compiled = True
+            return
+
         # get number of variables and constraints
         if nvar is not None:
             self.nvar = nvar
@@ -437,7 +604,7 @@ class IPM:
             if ce_precompile:
                 CE = self.ce
             else:
-                CE = aesara.function(inputs=[self.x_dev], outputs=self.ce)
+                CE = self.function(inputs=[self.x_dev], outputs=self.ce)
 
             c = CE(self.x0)
             self.neq = c.size
@@ -450,7 +617,7 @@ class IPM:
             if ci_precompile:
                 CI = self.ci
             else:
-                CI = aesara.function(inputs=[self.x_dev], outputs=self.ci)
+                CI = self.function(inputs=[self.x_dev], outputs=self.ci)
 
             c = CI(self.x0)
             self.nineq = c.size
@@ -459,40 +626,64 @@ class IPM:
         else:
             self.nineq = nineq
 
-        # declare device variables
-        if self.lambda_dev is None:
-            self.lambda_dev = aet.vector('lamda_dev')
+        # the reciprocal of the slack variables appears in the gradient, the merit function gradient, and the barrier
+        # cost gradient; build it once so that every expression shares the same subgraph
+        if self.nineq:
+            inv_s = aet.reciprocal(self.s_dev + self.eps)
 
-        # use automatic differentiation if gradient and/or Hessian (if applicable) of f expressions are not provided
+        # use automatic differentiation if gradient and/or Hessian (if applicable) of f expressions are not provided;
+        # automatically derived Hessians differentiate the first derivative expressions built here rather than
+        # having aesara.gradient.hessian() rebuild them
         if self.df is None:
             df = aet.grad(self.f, self.x_dev)
         else:
             df = self.df
-        if not self.lbfgs and self.d2f is None:
-            d2f = aesara.gradient.hessian(cost=self.f, wrt=self.x_dev)
+
+        # if no second derivatives are provided, the Hessian of the Lagrangian is taken as a single Jacobian of its
+        # gradient (one sweep over x) rather than as the sum of separate Hessians of f, ce, and ci (one sweep each)
+        auto_d2L = (not precompile and not self.lbfgs and self.d2f is None and (not self.neq or self.d2ce is None) and
+                    (not self.nineq or self.d2ci is None))
+
+        if not self.lbfgs and not auto_d2L and self.d2f is None:
+            if self.df is None:
+                d2f = aesara.gradient.jacobian(df, wrt=self.x_dev, disconnected_inputs='ignore')
+            else:
+                d2f = aesara.gradient.hessian(cost=self.f, wrt=self.x_dev)
         else:
             d2f = self.d2f
 
         # construct expression for the constraint Jacobians and Hessians (if exact Hessian is used)
         if self.neq:
-            if self.dce is None:
+            if self.dce is None and ce_precompile:
+                # functions cannot be differentiated symbolically, so their Jacobian is approximated numerically
+                dce = self.fd_jacobian(self.ce)
+                dce_precompile = True
+            elif self.dce is None:
                 dce = aesara.gradient.jacobian(self.ce, wrt=self.x_dev).reshape((self.neq, self.nvar)).T
             else:
                 dce = self.dce
-            if not self.lbfgs:
-                if self.d2ce is None:
+            if not self.lbfgs and not auto_d2L:
+                if self.d2ce is None and self.dce is None:
+                    d2ce = aesara.gradient.jacobian(aet.dot(dce, self.lambda_dev[:self.neq]), wrt=self.x_dev,
+                                                    disconnected_inputs='ignore')
+                elif self.d2ce is None:
                     d2ce = aesara.gradient.hessian(cost=aet.sum(self.ce * self.lambda_dev[:self.neq]), wrt=self.x_dev)
                 else:
                     d2ce = self.d2ce
 
         if self.nineq:
-            Sigma = diag(self.lambda_dev[self.neq:] / (self.s_dev + self.eps))
-            if self.dci is None:
+            if self.dci is None and ci_precompile:
+                dci = self.fd_jacobian(self.ci)
+                dci_precompile = True
+            elif self.dci is None:
                 dci = aesara.gradient.jacobian(self.ci, wrt=self.x_dev).reshape((self.nineq, self.nvar)).T
             else:
                 dci = self.dci
-            if not self.lbfgs:
-                if self.d2ci is None:
+            if not self.lbfgs and not auto_d2L:
+                if self.d2ci is None and self.dci is None:
+                    d2ci = aesara.gradient.jacobian(aet.dot(dci, self.lambda_dev[self.neq:]), wrt=self.x_dev,
+                                                    disconnected_inputs='ignore')
+                elif self.d2ci is None:
                     d2ci = aesara.gradient.hessian(cost=aet.sum(self.ci * self.lambda_dev[self.neq:]), wrt=self.x_dev)
                 else:
                     d2ci = self.d2ci
@@ -500,44 +691,44 @@ class IPM:
         # if some expressions have been precompiled into functions, compile any remaining expressions
         if precompile:
             if not f_precompile:
-                f_func = aesara.function(inputs=[self.x_dev], outputs=self.f)
+                f_func = self.function(inputs=[self.x_dev], outputs=self.f)
             else:
                 f_func = self.f
             if not df_precompile:
-                df_func = aesara.function(inputs=[self.x_dev], outputs=df)
+                df_func = self.x_function(df)
             else:
                 df_func = df
             if not self.lbfgs:
                 if not d2f_precompile:
-                    d2f_func = aesara.function(inputs=[self.x_dev], outputs=d2f)
+                    d2f_func = self.x_function(d2f)
                 else:
                     d2f_func = d2f
             if self.neq:
                 if not ce_precompile:
-                    ce_func = aesara.function(inputs=[self.x_dev], outputs=self.ce)
+                    ce_func = self.function(inputs=[self.x_dev], outputs=self.ce)
                 else:
                     ce_func = self.ce
                 if not dce_precompile:
-                    dce_func = aesara.function(inputs=[self.x_dev], outputs=dce.reshape((self.nvar, self.neq)))
+                    dce_func = self.x_function(dce.reshape((self.nvar, self.neq)))
                 else:
                     dce_func = lambda x: dce(x).reshape((self.nvar, self.neq))
                 if not self.lbfgs:
                     if not d2ce_precompile:
-                        d2ce_func = aesara.function(inputs=[self.x_dev, self.lambda_dev], outputs=d2ce)
+                        d2ce_func = self.function(inputs=[self.x_dev, self.lambda_dev], outputs=d2ce)
                     else:
                         d2ce_func = d2ce
             if self.nineq:
                 if not ci_precompile:
-                    ci_func = aesara.function(inputs=[self.x_dev, self.s_dev], outputs=self.ci - self.s_dev)
+                    ci_func = self.function(inputs=[self.x_dev, self.s_dev], outputs=self.ci - self.s_dev)
                 else:
                     ci_func = lambda x, s: self.ci(x) - s
                 if not dci_precompile:
-                    dci_func = aesara.function(inputs=[self.x_dev], outputs=dci.reshape((self.nvar, self.nineq)))
+                    dci_func = self.x_function(dci.reshape((self.nvar, self.nineq)))
                 else:
                     dci_func = lambda x: dci(x).reshape((self.nvar, self.nineq))
                 if not self.lbfgs:
                     if not d2ci_precompile:
-                        d2ci_func = aesara.function(inputs=[self.x_dev, self.lambda_dev], outputs=d2ci)
+                        d2ci_func = self.function(inputs=[self.x_dev, self.lambda_dev], outputs=d2ci)
                     else:
                         d2ci_func = d2ci
 
@@ -552,34 +743,36 @@ class IPM:
                 else:
                     con = lambda x, s: ci_func(x, s).reshape((self.nineq,))
             else:
-                con = aet.zeros((self.neq + self.nineq,))
+                con = []
                 if self.neq:
-                    con = aet.set_subtensor(con[:self.neq], self.ce)
+                    con.append(self.ce.reshape((self.neq,)))
                 if self.nineq:
-                    con = aet.set_subtensor(con[self.neq:], self.ci - self.s_dev)
+                    con.append((self.ci - self.s_dev).reshape((self.nineq,)))
+                con = aet.concatenate(con, axis=0)
 
         # construct composite expression for the constraints Jacobian
         if self.neq or self.nineq:
             if precompile:
                 if self.neq and self.nineq:
-                    jaco_top = lambda x: np.concatenate([dce_func(x).reshape((self.nvar, self.neq)),
-                                                         dci_func(x).reshape((self.nvar, self.nineq))], axis=1)
+                    jaco_top = lambda x: np.concatenate([dce_func(x), dci_func(x)], axis=1)
                     jaco_bottom = np.concatenate([np.zeros((self.nineq, self.neq)), -np.eye(self.nineq)], axis=1)
                     jaco = lambda x: np.concatenate([jaco_top(x), jaco_bottom], axis=0)
                 elif self.neq:
-                    jaco = lambda x: dce_func(x).reshape((self.nvar, self.neq))
+                    jaco = dce_func
                 else:
-                    jaco = lambda x: np.concatenate([
-                        dci_func(x).reshape((self.nvar, self.nineq)),
-                        -np.eye(self.nineq)
-                    ], axis=0)
+                    jaco = lambda x: np.concatenate([dci_func(x), -np.eye(self.nineq)], axis=0)
             else:
-                jaco = aet.zeros((self.nvar + self.nineq, self.neq + self.nineq))
+                jaco = []
                 if self.neq:
-                    jaco = aet.set_subtensor(jaco[:self.nvar, :self.neq], dce)
+                    jaco.append(dce.reshape((self.nvar, self.neq)))
+                if self.nineq:
+                    jaco.append(dci.reshape((self.nvar, self.nineq)))
+                jaco = aet.concatenate(jaco, axis=1)
                 if self.nineq:
-                    jaco = aet.set_subtensor(jaco[:self.nvar, self.neq:], dci)
-                    jaco = aet.set_subtensor(jaco[self.nvar:, self.neq:], -aet.eye(self.nineq))
+                    jaco_bottom = -aet.eye(self.nineq)
+                    if self.neq:
+                        jaco_bottom = aet.concatenate([aet.zeros((self.nineq, self.neq)), jaco_bottom], axis=1)
+                    jaco = aet.concatenate([jaco, jaco_bottom], axis=0)
 
         # construct expression for the gradient
         if precompile:
@@ -594,23 +787,21 @@ class IPM:
                 grad_x = lambda x, lda: df_func(x)
 
             if self.nineq:
-                grad_s = self.lambda_dev[self.neq:] - self.mu_dev / (self.s_dev + self.eps)
-                grad_s = aesara.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev], outputs=grad_s,
-                                         on_unused_input='ignore')
+                grad_s = self.lambda_dev[self.neq:] - self.mu_dev * inv_s
+                grad_s = self.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev], outputs=grad_s)
 
             if self.neq:
                 if ce_precompile:
                     grad_lda_eq = lambda x: ce_func(x).ravel()
                 else:
-                    grad_lda_eq = aesara.function(inputs=[self.x_dev], outputs=self.ce.ravel(),
-                                                  on_unused_input='ignore')
+                    grad_lda_eq = self.function(inputs=[self.x_dev], outputs=self.ce.ravel())
 
             if self.nineq:
                 if ci_precompile:
                     grad_lda_ineq = lambda x, s: ci_func(x, s).ravel()
                 else:
-                    grad_lda_ineq = aesara.function(inputs=[self.x_dev, self.s_dev],
-                                                    outputs=(self.ci - self.s_dev).ravel(), on_unused_input='ignore')
+                    grad_lda_ineq = self.function(inputs=[self.x_dev, self.s_dev],
+                                                  outputs=(self.ci - self.s_dev).ravel())
 
             if self.neq and self.nineq:
                 grad = lambda x, s, lda: np.concatenate([grad_x(x, lda), grad_s(x, s, lda), grad_lda_eq(x),
@@ -623,106 +814,101 @@ class IPM:
             else:
                 grad = lambda x, s, lda: grad_x(x, lda)
         else:
-            grad = aet.zeros((self.nvar + 2 * self.nineq + self.neq,))
-            grad = aet.set_subtensor(grad[:self.nvar], df)
+            # the blocks are joined rather than scattered into a zero vector
+            grad_x = df
             if self.neq:
-                grad = aet.inc_subtensor(grad[:self.nvar], -aet.dot(dce, self.lambda_dev[:self.neq]))
-                grad = aet.set_subtensor(grad[self.nvar + self.nineq:self.nvar + self.nineq + self.neq], self.ce)
+                grad_x -= aet.dot(dce, self.lambda_dev[:self.neq])
             if self.nineq:
-                grad = aet.inc_subtensor(grad[:self.nvar], -aet.dot(dci, self.lambda_dev[self.neq:]))
-                grad = aet.set_subtensor(grad[self.nvar:self.nvar + self.nineq], self.lambda_dev[self.neq:] -
-                                       self.mu_dev / (self.s_dev + self.eps))
-                grad = aet.set_subtensor(grad[self.nvar + self.nineq + self.neq:], self.ci - self.s_dev)
+                grad_x -= aet.dot(dci, self.lambda_dev[self.neq:])
+            grad = [grad_x]
+            if self.nineq:
+                grad.append(self.lambda_dev[self.neq:] - self.mu_dev * inv_s)
+            if self.neq:
+                grad.append(self.ce.reshape((self.neq,)))
+            if self.nineq:
+                grad.append((self.ci - self.s_dev).reshape((self.nineq,)))
+            grad = aet.concatenate(grad, axis=0)
+
+        # construct expression for the l1 norm of the constraint violations, which the merit function and its
+        # gradient share
+        if self.neq or self.nineq:
+            if precompile:
+                con_l1 = lambda x, s: np.sum(np.abs(con(x, s)))
+            else:
+                con_l1 = aet.sum(aet.abs_(con))
 
         # construct expressions for the merit function
         if precompile:
             if self.nineq:
                 bar_func = self.mu_dev * aet.sum(aet.log(self.s_dev))
-                bar_func = aesara.function(inputs=[self.s_dev], outputs=bar_func, on_unused_input='ignore')
-            if self.neq and self.nineq:
-                phi = lambda x, s: (f_func(x) + self.nu_dev.get_value() *
-                                    (np.sum(np.abs(ce_func(x))) + np.sum(np.abs(ci_func(x, s)))) - bar_func(s))
+                bar_func = self.function(inputs=[self.s_dev], outputs=bar_func)
+                phi = lambda x, s: f_func(x) + self.nu_dev.get_value() * con_l1(x, s) - bar_func(s)
             elif self.neq:
-                phi = lambda x, s: f_func(x) + self.nu_dev.get_value() * np.sum(np.abs(ce_func(x)))
-            elif self.nineq:
-                phi = lambda x, s: f_func(x) + self.nu_dev.get_value() * np.sum(np.abs(ci_func(x, s))) - bar_func(s)
+                phi = lambda x, s: f_func(x) + self.nu_dev.get_value() * con_l1(x, s)
             else:
                 phi = lambda x, s: f_func(x)
         else:
             phi = self.f
-            if self.neq:
-                phi += self.nu_dev * aet.sum(aet.abs_(self.ce))
-            if self.nineq:
-                phi += self.nu_dev * aet.sum(aet.abs_(self.ci - self.s_dev)) - self.mu_dev * aet.sum(aet.log(self.s_dev))
-
-        # construct expressions for the merit function gradient
-        if precompile:
-            if self.nineq:
-                dbar_func = aet.dot(self.mu_dev / (self.s_dev + self.eps), self.dz_dev[self.nvar:])
-                dbar_func = aesara.function(inputs=[self.s_dev, self.dz_dev], outputs=dbar_func,
-                                            on_unused_input='ignore')
-            if self.neq and self.nineq:
-                dphi = lambda x, s, dz: (np.dot(df_func(x), dz[:self.nvar]) - self.nu_dev.get_value() *
-                                         (np.sum(np.abs(ce_func(x))) + np.sum(np.abs(ci_func(x, s)))) -
-                                         dbar_func(s, dz))
-            elif self.neq:
-                dphi = lambda x, s, dz: (np.dot(df_func(x), dz[:self.nvar]) -
-                                         self.nu_dev.get_value() * np.sum(np.abs(ce_func(x))))
-            elif self.nineq:
-                dphi = lambda x, s, dz: (np.dot(df_func(x), dz[:self.nvar]) - self.nu_dev.get_value() *
-                                         np.sum(np.abs(ci_func(x, s))) - dbar_func(s, dz))
-            else:
-                dphi = lambda x, s, dz: np.dot(df_func(x), dz[:self.nvar])
-        else:
-            dphi = aet.dot(df, self.dz_dev[:self.nvar])
-            if self.neq:
-                dphi -= self.nu_dev * aet.sum(aet.abs_(self.ce))
+            if self.neq or self.nineq:
+                phi += self.nu_dev * con_l1
             if self.nineq:
-                dphi -= (self.nu_dev * aet.sum(aet.abs_(self.ci - self.s_dev)) +
-                         aet.dot(self.mu_dev / (self.s_dev + self.eps), self.dz_dev[self.nvar:]))
+                phi -= self.mu_dev * aet.sum(aet.log(self.s_dev))
 
-        # construct expression for initializing the Lagrange multipliers
+        # construct expressions for initializing the Lagrange multipliers (the least-squares problem
+        # jaco[:nvar, :]*lda = df is solved on the host rather than through a symbolic pseudoinverse)
         if self.neq or self.nineq:
             if precompile:
-                init_lambda = lambda x: np.dot(np.linalg.pinv(jaco(x)[:self.nvar, :]),
-                                               df_func(x).reshape((self.nvar, 1))).reshape((self.neq + self.nineq,))
+                init_lambda = lambda x: (jaco(x)[:self.nvar, :], df_func(x))
             else:
-                init_lambda = aet.dot(pinv(jaco[:self.nvar, :]),
-                                    df.reshape((self.nvar, 1))).reshape((self.neq + self.nineq,))
+                init_lambda = [jaco[:self.nvar, :], df]
 
         # construct expression for initializing the slack variables
         if self.nineq:
             if precompile:
-                init_slack = lambda x: np.max(np.concatenate([
-                    ci_func(x, np.zeros((self.nineq,))).reshape((self.nineq, 1)),
-                    self.Ktol * np.ones((self.nineq, 1))
-                ], axis=1), axis=1)
+                init_slack = lambda x: np.maximum(ci_func(x, np.zeros((self.nineq,))).reshape((self.nineq,)),
+                                                  self.float_dtype(self.Ktol))
             else:
-                init_slack = aet.max(aet.concatenate([
-                    self.ci.reshape((self.nineq, 1)),
-                    self.Ktol * aet.ones((self.nineq, 1))
-                ], axis=1), axis=1)
+                init_slack = aet.maximum(self.ci.reshape((self.nineq,)), self.float_dtype(self.Ktol))
 
         # construct expression for gradient of f( + the barrier function)
         if precompile:
             if self.nineq:
-                dbar_func2 = -self.mu_dev / (self.s_dev + self.eps)
-                dbar_func2 = aesara.function(inputs=[self.s_dev], outputs=dbar_func2, on_unused_input='ignore')
+                dbar_func2 = -self.mu_dev * inv_s
+                dbar_func2 = self.function(inputs=[self.s_dev], outputs=dbar_func2)
                 barrier_cost_grad = lambda x, s: np.concatenate([df_func(x), dbar_func2(s)], axis=0)
             else:
                 barrier_cost_grad = lambda x, s: df_func(x)
         else:
-            barrier_cost_grad = aet.zeros((self.nvar + self.nineq,))
-            barrier_cost_grad = aet.set_subtensor(barrier_cost_grad[:self.nvar], df)
             if self.nineq:
-                barrier_cost_grad = aet.set_subtensor(barrier_cost_grad[self.nvar:],
-                                                    -self.mu_dev / (self.s_dev + self.eps))
+                barrier_cost_grad = aet.concatenate([df, -self.mu_dev * inv_s], axis=0)
+            else:
+                barrier_cost_grad = df
+
+        # construct the terms of the merit function and of its directional derivative that are evaluated together at
+        # the start of each step: the barrier cost (f and the barrier function), its gradient, and the l1 norm of the
+        # constraint violations
+        if precompile:
+            if self.nineq:
+                barrier_cost = lambda x, s: f_func(x) - bar_func(s)
+            else:
+                barrier_cost = lambda x, s: f_func(x)
+            if self.neq or self.nineq:
+                merit_terms = lambda x, s: (barrier_cost(x, s), barrier_cost_grad(x, s), con_l1(x, s))
+            else:
+                merit_terms = lambda x, s: (barrier_cost(x, s), barrier_cost_grad(x, s), 0.0)
+        else:
+            barrier_cost = self.f
+            if self.nineq:
+                barrier_cost -= self.mu_dev * aet.sum(aet.log(self.s_dev))
+            merit_terms = [barrier_cost, barrier_cost_grad]
+            if self.neq or self.nineq:
+                merit_terms.append(con_l1)
 
         # construct expression for the Hessian of the Lagrangian (assumes Lagrange multipliers included in
-        # d2ce/d2ci expressions), if applicable
+        # d2ce/d2ci expressions), if applicable; the symmetric Hessian matrix itself is assembled on the host (see
+        # grad_hess)
         if not self.lbfgs:
             if precompile:
-                # construct expression for the Hessian of the Lagrangian
                 if self.neq and self.nineq:
                     d2L = lambda x, lda: d2f_func(x) - d2ce_func(x, lda) - d2ci_func(x, lda)
                 elif self.neq:
@@ -731,181 +917,241 @@ class IPM:
                     d2L = lambda x, lda: d2f_func(x) - d2ci_func(x, lda)
                 else:
                     d2L = lambda x, lda: d2f_func(x)
-
-                # construct expression for the symmetric Hessian matrix
-                if self.neq or self.nineq:
-                    if self.nineq:
-                        hess_upper_left = lambda x, s, lda: np.concatenate([
-                            np.concatenate([
-                                np.triu(d2L(x, lda)),
-                                np.zeros((self.nvar, self.nineq))
-                            ], axis=1),
-                            np.concatenate([
-                                np.zeros((self.nineq, self.nvar)),
-                                np.diag(lda[self.neq:] / (s + self.eps))
-                            ], axis=1)
-                        ], axis=0)
-                    else:
-                        hess_upper_left = lambda x, s, lda: np.triu(d2L(x, lda))
-                    hess_upper_right = lambda x: jaco(x)
-                    hess_upper = lambda x, s, lda: np.concatenate([
-                        hess_upper_left(x, s, lda),
-                        hess_upper_right(x)
-                    ], axis=1)
-                    hess_triu = lambda x, s, lda: np.concatenate([
-                        hess_upper(x, s, lda),
-                        np.zeros((self.neq + self.nineq, self.nvar + 2 * self.nineq + self.neq))
-                    ], axis=0)
-                    hess = lambda x, s, lda: hess_triu(x, s, lda) + np.triu(hess_triu(x, s, lda), k=1).T
-                else:
-                    hess_triu = lambda x, s, lda: np.triu(d2L(x, lda))
-                    hess = lambda x, s, lda: hess_triu(x, s, lda) + np.triu(hess_triu(x, s, lda), k=1).T
+            elif auto_d2L:
+                d2L = aesara.gradient.jacobian(grad_x, wrt=self.x_dev, disconnected_inputs='ignore')
             else:
-                # construct expression for the Hessian of the Lagrangian
                 d2L = d2f
                 if self.neq:
                     d2L -= d2ce
                 if self.nineq:
                     d2L -= d2ci
 
-                # construct expression for the symmetric Hessian matrix
-                hess = aet.zeros((self.nvar + 2 * self.nineq + self.neq, self.nvar + 2 * self.nineq + self.neq))
-                hess = aet.set_subtensor(hess[:self.nvar, :self.nvar], aet.triu(d2L))
-                if self.neq:
-                    hess = aet.set_subtensor(
-                        hess[:self.nvar, (self.nvar + self.nineq):(self.nvar + self.nineq + self.neq)],
-                        dce
-                    )
-                if self.nineq:
-                    hess = aet.set_subtensor(hess[:self.nvar, (self.nvar + self.nineq + self.neq):], dci)
-                    hess = aet.set_subtensor(hess[self.nvar:(self.nvar + self.nineq), self.nvar:(self.nvar + self.nineq)],
-                                           Sigma)  # aet.triu(Sigma))
-                    hess = aet.set_subtensor(
-                        hess[self.nvar:(self.nvar + self.nineq), (self.nvar + self.nineq + self.neq):],
-                        -aet.eye(self.nineq)
-                    )
-                hess = aet.triu(hess) + aet.triu(hess).T
-                hess = hess - aet.diag(aet.diagonal(hess) / 2.0)
-
-        # construct expression for general linear system solve
-        # gen_solve = aet.slinalg.solve(self.M_dev, self.b_dev)
-
-        # construct expression for symmetric linear system solve
-        sym_solve = aet.slinalg.Solve(assume_a='sym')
-        sym_solve = sym_solve(self.M_dev, self.b_dev)
-
-        # if using L-BFGS, get the expression for the descent direction
-        if self.lbfgs:
-            dz, dz_sqr = self.lbfgs_builder()
-
         # compile expressions into device functions
         if precompile:
             self.cost = f_func
         else:
-            self.cost = aesara.function(inputs=[self.x_dev], outputs=self.f)
+            self.cost = self.function(inputs=[self.x_dev], outputs=self.f)
 
         if precompile:
-            self.barrier_cost_grad = barrier_cost_grad
+            self.merit_terms = merit_terms
+        elif self.neq or self.nineq:
+            self.merit_terms = self.function(inputs=[self.x_dev, self.s_dev], outputs=merit_terms)
         else:
-            self.barrier_cost_grad = aesara.function(inputs=[self.x_dev, self.s_dev],
-                                                     outputs=barrier_cost_grad, on_unused_input='ignore')
+            merit_terms = self.function(inputs=[self.x_dev, self.s_dev], outputs=merit_terms)
+            self.merit_terms = lambda x, s: merit_terms(x, s) + [0.0]
 
         if precompile:
             self.grad = grad
         else:
-            self.grad = aesara.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev],
-                                        outputs=grad, on_unused_input='ignore')
+            self.grad = self.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev], outputs=grad)
 
-        if self.lbfgs:
-            self.lbfgs_dir_func = aesara.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev, self.g_dev,
-                                                          self.zeta_dev, self.S_dev, self.Y_dev, self.SS_dev,
-                                                          self.L_dev, self.D_dev, self.B_dev],
-                                                  outputs=dz, on_unused_input='ignore')
-            if dz_sqr is not None:
-                self.lbfgs_dir_func_sqr = aesara.function(inputs=[self.x_dev, self.s_dev, self.lambda_dev, self.g_dev,
-                                                                  self.zeta_dev, self.s_dev, self.Y_dev, self.SS_dev,
-                                                                  self.L_dev, self.D_dev, self.B_dev],
-                                                          outputs=dz_sqr, on_unused_input='ignore')
-        else:
+        # the gradient and the nonlinear blocks of the Hessian are always needed at the same point, so they share a
+        # single device function
+        if not self.lbfgs:
             if precompile:
-                self.hess = hess
+                if self.neq or self.nineq:
+                    self.grad_d2L = lambda x, s, lda: (grad(x, s, lda), d2L(x, lda), jaco(x)[:self.nvar, :])
+                else:
+                    self.grad_d2L = lambda x, s, lda: (grad(x, s, lda), d2L(x, lda))
             else:
-                self.hess = aesara.function(
+                outputs = [grad, d2L]
+                if self.neq or self.nineq:
+                    outputs.append(jaco[:self.nvar, :])
+                self.grad_d2L = self.function(
                     inputs=[self.x_dev, self.s_dev, self.lambda_dev],
-                    outputs=hess, on_unused_input='ignore'
+                    outputs=outputs
                 )
 
+            # preallocate the symmetric Hessian matrix; the constant -I blocks coupling the slacks and the inequality
+            # constraints are only written once
+            size = self.nvar + 2 * self.nineq + self.neq
+            self.hess_buf = np.zeros((size, size), dtype=self.solve_dtype, order='F')
+            if self.nineq:
+                idx = np.arange(self.nineq)
+                self.hess_buf[self.nvar + idx, self.nvar + self.nineq + self.neq + idx] = -1.0
+                self.hess_buf[self.nvar + self.nineq + self.neq + idx, self.nvar + idx] = -1.0
+
         if precompile:
             self.phi = phi
         else:
-            self.phi = aesara.function(
+            self.phi = self.function(
                 inputs=[self.x_dev, self.s_dev],
-                outputs=phi, on_unused_input='ignore'
-            )
-
-        if precompile:
-            self.dphi = dphi
-        else:
-            self.dphi = aesara.function(
-                inputs=[self.x_dev, self.s_dev, self.dz_dev],
-                outputs=dphi, on_unused_input='ignore'
+                outputs=phi
             )
 
-        self.eigh = aesara.function(
-            inputs=[self.M_dev],
-            outputs=eigvalsh(self.M_dev, aet.eye(self.M_dev.shape[0])),
-        )
-
-        self.sym_solve = aesara.function(
-            inputs=[self.M_dev, self.b_dev],
-            outputs=sym_solve,
-        )
-
-        # self.gen_solve = aesara.function(
-        #    inputs=[self.M_dev, self.b_dev],
-        #    outputs=gen_solve,
-        # )
-
         if self.neq or self.nineq:
             if precompile:
                 self.con = con
             else:
-                self.con = aesara.function(
+                self.con = self.function(
                     inputs=[self.x_dev, self.s_dev],
-                    outputs=con, on_unused_input='ignore'
+                    outputs=con
                 )
 
             if precompile:
                 self.jaco = jaco
             else:
-                self.jaco = aesara.function(
+                self.jaco = self.function(
                     inputs=[self.x_dev],
-                    outputs=jaco,
-                    on_unused_input='ignore',
+                    outputs=jaco
                 )
 
             if precompile:
-                self.init_lambda = init_lambda
+                init_lambda_lstsq = init_lambda
             else:
-                self.init_lambda = aesara.function(
+                init_lambda_lstsq = self.function(
                     inputs=[self.x_dev],
                     outputs=init_lambda,
                 )
+            # QR with column pivoting (?gelsy) is much cheaper than the SVD behind a pseudoinverse
+            self.init_lambda = lambda x: scipy.linalg.lstsq(*init_lambda_lstsq(x), lapack_driver='gelsy',
+                                                            check_finite=False)[0]
 
         if self.nineq:
             if precompile:
                 self.init_slack = init_slack
             else:
-                self.init_slack = aesara.function(
+                self.init_slack = self.function(
                     inputs=[self.x_dev],
                     outputs=init_slack,
                 )
 
+        # construct the function that splits the gradient into the KKT conditions; it is specialized here for the
+        # number of constraints so that KKT does not need to branch on every call (the conditions are always returned
+        # in 64-bit precision, see KKT)
+        i1 = self.nvar
+        i2 = self.nvar + self.nineq
+        i3 = self.nvar + self.nineq + self.neq
+        zero = np.float64(0.0)
+        if self.neq and self.nineq:
+            self.kkt_split = lambda kkts, s: (kkts[:i1], kkts[i1:i2] * s, kkts[i2:i3], kkts[i3:])
+        elif self.neq:
+            self.kkt_split = lambda kkts, s: (kkts[:i1], zero, kkts[i2:i3], zero)
+        elif self.nineq:
+            self.kkt_split = lambda kkts, s: (kkts[:i1], kkts[i1:i2] * s, zero, kkts[i3:])
+        else:
+            self.kkt_split = lambda kkts, s: (kkts[:i1], zero, zero, zero)
+
+        # reset the cached factorization of the constraints Jacobian
+        self.jaco_factor_cache = None
+
+        # cache exactly the attributes that this configuration compiled
+        names = ['nvar', 'neq', 'nineq', 'lambda_dev', 'cost', 'merit_terms', 'grad', 'phi', 'kkt_split']
+        if not self.lbfgs:
+            names += ['grad_d2L', 'hess_buf']
+        if self.neq or self.nineq:
+            names += ['con', 'jaco', 'init_lambda']
+        if self.nineq:
+            names.append('init_slack')
+        self.compile_cache[sig] = (exprs, {name: getattr(self, name) for name in names})
+
         self.compiled = True
 
-    def KKT(self, x, s, lda):
+    def grad_hess(self, x, s, lda):
+        """Evaluate the gradient of the Lagrangian barrier problem and, if the
+           exact Hessian is used, the symmetric Hessian matrix. The Hessian is
+           assembled block by block in a preallocated buffer that is
+           overwritten on every call. If L-BFGS is used, the Hessian is None.
+        """
+        if self.lbfgs:
+            return self.grad(x, s, lda), None
+
+        if self.neq or self.nineq:
+            grad, d2L, jaco = self.grad_d2L(x, s, lda)
+        else:
+            grad, d2L = self.grad_d2L(x, s, lda)
+
+        # write the Hessian of the Lagrangian symmetrically from its upper triangle
+        H = self.hess_buf
+        H[:self.nvar, :self.nvar] = d2L
+        ind = np.tril_indices(self.nvar, -1)
+        H[ind] = H[ind[1], ind[0]]
+
+        if self.neq or self.nineq:
+            # write the constraints Jacobian and its transpose
+            H[:self.nvar, self.nvar + self.nineq:] = jaco
+            H[self.nvar + self.nineq:, :self.nvar] = jaco.T
+            # clear any regularization of the lower right block left over from the previous iteration
+            H[self.nvar + self.nineq:, self.nvar + self.nineq:] = 0.0
+        if self.nineq:
+            # write Sigma along the diagonal of the slack variables block
+            idx = np.arange(self.nvar, self.nvar + self.nineq)
+            H[idx, idx] = lda[self.neq:] / (s + self.eps)
+
+        return grad, H
+
+    @staticmethod
+    def sym_solve(M, b, overwrite_a=False, overwrite_b=False, lower=False):
+        """Solve the symmetric linear system M*x = b on the host. The system
+           matrices are assembled in NumPy, so LAPACK's Bunch-Kaufman solver
+           (?sysv) is called directly rather than round-tripping through a
+           compiled aesara function or scipy.linalg.solve (which also estimates
+           the condition number on every call). b may be a vector or a matrix
+           of right-hand sides; if overwrite_b is set and b is a Fortran-ordered
+           buffer, the solution is written into b. Only the upper triangle of M
+           is referenced, or the lower triangle if lower is set.
+        """
+        sysv, = scipy.linalg.get_lapack_funcs(('sysv',), (M, b))
+        _, _, x, info = sysv(M, b, lower=int(lower), overwrite_a=overwrite_a, overwrite_b=overwrite_b)
+        if info > 0:
+            raise np.linalg.LinAlgError('Matrix is singular.')
+        elif info < 0:
+            raise ValueError('Illegal value in argument {} of internal sysv.'.format(-info))
+        return x
+
+    @staticmethod
+    def inertia(M, b=None):
+        """Return the number of negative eigenvalues of the symmetric matrix M
+           and an estimate of its reciprocal condition number in the 1-norm.
+           Both are obtained from a Bunch-Kaufman factorization M = L*D*L^T
+           (?sytrf): by Sylvester's law of inertia, M has as many negative
+           eigenvalues as the block diagonal D, and ?sycon estimates the
+           condition number from the same factors. If b is given, M is factored
+           by ?sysv instead, which also solves M*x = b with the same factors,
+           and the solution x is returned as a third value (None if M is
+           singular).
+        """
+        sytrf, sysv, sycon, lange = scipy.linalg.get_lapack_funcs(('sytrf', 'sysv', 'sycon', 'lange'), (M,))
+        if b is None:
+            ldu, ipiv, info = sytrf(M, lower=1)
+            name = 'sytrf'
+        else:
+            ldu, ipiv, x, info = sysv(M, b, lower=1)
+            name = 'sysv'
+        if info < 0:
+            raise ValueError('Illegal value in argument {} of internal {}.'.format(-info, name))
+
+        # count the negative eigenvalues of the 1x1 and 2x2 diagonal blocks of D
+        eps = np.finfo(ldu.dtype).eps
+        n_neg = 0
+        k = 0
+        while k < ldu.shape[0]:
+            if ipiv[k] > 0:
+                n_neg += ldu[k, k] < -eps
+                k += 1
+            else:
+                a, b, c = ldu[k, k], ldu[k + 1, k], ldu[k + 1, k + 1]
+                r = np.hypot(0.5 * (a - c), b)
+                n_neg += (0.5 * (a + c) - r < -eps) + (0.5 * (a + c) + r < -eps)
+                k += 2
+
+        if info > 0:
+            # D is exactly singular
+            rcond = 0.0
+        else:
+            rcond, _ = sycon(ldu, ipiv, lange('1', M), lower=1)
+
+        if b is None:
+            return int(n_neg), rcond
+        return int(n_neg), rcond, (x if info == 0 else None)
+
+    def KKT(self, x, s, lda, kkts=None):
         """Calculate the first-order Karush-Kuhn-Tucker conditions. Irrelevant
-           conditions are set to zero.
+           conditions are set to zero. If the gradient of the Lagrangian at
+           (x, s, lda) has already been evaluated, it may be passed as kkts to
+           avoid evaluating it again. The conditions are returned in 64-bit
+           precision regardless of float_dtype so that the convergence tests
+           on their norms do not stagnate at 32-bit round-off.
         """
         # kkt1 is the gradient of the Lagrangian with respect to x (weights)
         # kkt2 is the gradient of the Lagrangian with respect to s (slack variables)
@@ -913,71 +1159,73 @@ class IPM:
         #   multipliers)
         # kkt4 is the gradient of the Lagrangian with respect to lda[self.neq:] (inequality constraints Lagrange
         #   multipliers)
-        kkts = self.grad(x, s, lda)
+        if kkts is None:
+            kkts = self.grad(x, s, lda)
 
-        if self.neq and self.nineq:
-            kkt1 = kkts[:self.nvar]
-            kkt2 = kkts[self.nvar:(self.nvar + self.nineq)] * s
-            kkt3 = kkts[(self.nvar + self.nineq):(self.nvar + self.nineq + self.neq)]
-            kkt4 = kkts[(self.nvar + self.nineq + self.neq):]
-        elif self.neq:
-            kkt1 = kkts[:self.nvar]
-            kkt2 = self.float_dtype(0.0)
-            kkt3 = kkts[(self.nvar + self.nineq):(self.nvar + self.nineq + self.neq)]
-            kkt4 = self.float_dtype(0.0)
-        elif self.nineq:
-            kkt1 = kkts[:self.nvar]
-            kkt2 = kkts[self.nvar:(self.nvar + self.nineq)] * s
-            kkt3 = self.float_dtype(0.0)
-            kkt4 = kkts[(self.nvar + self.nineq + self.neq):]
-        else:
-            kkt1 = kkts[:self.nvar]
-            kkt2 = self.float_dtype(0.0)
-            kkt3 = self.float_dtype(0.0)
-            kkt4 = self.float_dtype(0.0)
+        return self.kkt_split(kkts.astype(np.float64, copy=False), s)
 
-        return kkt1, kkt2, kkt3, kkt4
+    @staticmethod
+    def kkt_converged(kkt, tol):
+        """Return True if the 2-norm of each of the KKT conditions returned by
+           KKT is at most tol. The squared norms are compared so that each
+           condition costs a single dot product, and the test stops at the
+           first condition that exceeds the tolerance.
+        """
+        tol_sq = tol * tol
+        return all(np.dot(k, k) <= tol_sq for k in kkt)
 
     def lbfgs_init(self):
         """Initialize storage arrays for L-BFGS algorithm.
         """
-        # initialize diagonal constant and storage arrays
-        zeta = self.float_dtype(self.lbfgs_zeta)
-        S = np.array([], dtype=self.float_dtype).reshape((self.nvar, 0))
-        Y = np.array([], dtype=self.float_dtype).reshape((self.nvar, 0))
-        SS = np.array([], dtype=self.float_dtype).reshape((0, 0))
-        L = np.array([], dtype=self.float_dtype).reshape((0, 0))
-        D = np.array([], dtype=self.float_dtype).reshape((0, 0))
+        # initialize diagonal constant and failure counter
+        zeta = self.solve_dtype(self.lbfgs_zeta)
         lbfgs_fail = 0
 
-        return zeta, S, Y, SS, L, D, lbfgs_fail
-
-    def lbfgs_builder(self):
-        """Build the L-BFGS search direction calculation in aesara.
-        """
-        # gradient vector
-        self.g_dev = aet.vector('self.g_dev')
-
-        # initial guess of Hessian
-        self.zeta_dev = aet.scalar('self.zeta_dev')
-
-        # storage arrays
-        self.S_dev = aet.matrix('S_dev')
-        self.Y_dev = aet.matrix('Y_dev')
-        self.SS_dev = aet.matrix('SS_dev')
-        self.L_dev = aet.matrix('L_dev')
-        self.D_dev = aet.matrix('D_dev')
-
-        # Jacobian transposed
+        # preallocate the storage arrays at their maximum size (up to self.lbfgs + 1 displacements are stored); the
+        # arrays handed to lbfgs_update and lbfgs_dir are views of their leading rows/columns; the displacements are
+        # stored as the rows of S and Y so that each one is contiguous in memory
+        m_max = self.lbfgs + 1
+        self.lbfgs_S = np.zeros((m_max, self.nvar), dtype=self.solve_dtype)
+        self.lbfgs_Y = np.zeros((m_max, self.nvar), dtype=self.solve_dtype)
+        self.lbfgs_SS = np.zeros((m_max, m_max), dtype=self.solve_dtype)
+        self.lbfgs_L = np.zeros((m_max, m_max), dtype=self.solve_dtype)
+        self.lbfgs_D = np.zeros((m_max, m_max), dtype=self.solve_dtype)
+        S = self.lbfgs_S[:0]
+        Y = self.lbfgs_Y[:0]
+        SS = self.lbfgs_SS[:0, :0]
+        L = self.lbfgs_L[:0, :0]
+        D = self.lbfgs_D[:0, :0]
+
+        # index of the oldest stored displacements once the storage arrays are full (see lbfgs_update)
+        self.lbfgs_head = 0
+
+        # preallocate the work buffers for U, M^(-1), and the stacked right-hand sides in lbfgs_dir at their maximum
+        # size; the buffers are Fortran-ordered so that their leading columns form a contiguous block that LAPACK can
+        # work on in place
         if self.neq or self.nineq:
-            self.B_dev = aet.matrix('B_dev')
+            self.lbfgs_W = np.zeros((self.nvar + self.nineq, 2 * m_max), dtype=self.solve_dtype, order='F')
+            self.lbfgs_Minv = np.zeros((2 * m_max, 2 * m_max), dtype=self.solve_dtype, order='F')
+            self.lbfgs_rhs = np.zeros((self.neq + self.nineq, 1 + 2 * m_max), dtype=self.solve_dtype, order='F')
         else:
-            self.B_dev = aet.scalar('B_dev')
+            # the compact inverse Hessian approximation for unconstrained problems uses S^T*Y and Y^T*Y (in storage
+            # order) instead of SS and L
+            self.lbfgs_SY = np.zeros((m_max, m_max), dtype=self.solve_dtype)
+            self.lbfgs_YY = np.zeros((m_max, m_max), dtype=self.solve_dtype)
 
-        # get the current number of L-BFGS updates
-        m_lbfgs = self.S_dev.shape[1]
+        return zeta, S, Y, SS, L, D, lbfgs_fail
+
+    def lbfgs_dir(self, x, s, lda, g, zeta, S, Y, SS, L, D):
+        """Calculate the search direction for the L-BFGS algorithm.
 
-        sym_solve = aet.slinalg.Solve(assume_a='sym')
+           The direction is computed on the host with NumPy and LAPACK rather
+           than compiled into an aesara graph: the number of stored updates
+           changes between iterations, the factorizations are reused across
+           several right-hand sides, and the pair ordering in the circular
+           buffer is only known at run time.
+        """
+        # get the current number of L-BFGS updates
+        m_lbfgs = S.shape[0]
+        g = g.astype(self.solve_dtype, copy=False)
 
         if self.neq or self.nineq:
             # For constrained problems, the search direction is
@@ -992,218 +1240,232 @@ class IPM:
             #         |_ dce^T, dci^T,   0,    0 _|   |_   0,   0_|
             #          _                         _     _ _          _            _
             #         |       A.            B     |   | W |*M^(-1)*|_W^T, 0, 0, 0_|
-            #       = |                           | _ | 0 |                         = Z - U*M^(-1)*U^aet.
+            #       = |                           | _ | 0 |                         = Z - U*M^(-1)*U^T.
             #         |      B^T,           D     |   | 0 |
             #         |_                         _|   |_0_|
             #
             # The approximate Hessian is inverted using the Woodbury matrix identity:
             #
             #     H^(-1) = Z^(-1) - Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1).
+            #
+            # Each matrix that is solved against more than once is factored once and the factors are reused.
+            B = self.jaco(x).astype(self.solve_dtype, copy=False)
+            g_top = g[:self.nvar + self.nineq]
+            g_bottom = g[self.nvar + self.nineq:]
 
             # construct diagonal of 'A'
-            Adiag = self.zeta_dev * aet.ones((self.nvar, 1))
+            Adiag = np.empty((self.nvar + self.nineq,), dtype=self.solve_dtype)
+            Adiag[:self.nvar] = zeta
             if self.nineq:
-                Sigma = (self.lambda_dev[self.neq:] / (self.s_dev + self.eps)).reshape((self.nineq, 1))
-                Adiag = aet.concatenate([Adiag, Sigma], axis=0)
+                Adiag[self.nvar:] = lda[self.neq:] / (s + self.eps)
+
+            # construct U and M^(-1) in place in the preallocated buffers (the rows of W for the slacks stay zero); only
+            # the lower triangle of M^(-1) is formed and referenced (see lbfgs_update)
+            W = self.lbfgs_W[:, :2 * m_lbfgs]
+            np.multiply(zeta, S.T, out=W[:self.nvar, :m_lbfgs])
+            W[:self.nvar, m_lbfgs:] = Y.T
+            Minv = self.lbfgs_Minv[:2 * m_lbfgs, :2 * m_lbfgs]
+            np.multiply(zeta, SS, out=Minv[:m_lbfgs, :m_lbfgs])
+            Minv[m_lbfgs:, :m_lbfgs] = L.T
+            np.negative(D, out=Minv[m_lbfgs:, m_lbfgs:])
+
+            B_factor = None
+            if B.shape[0] == B.shape[1]:
+                # factors are only returned if B is invertible
+                B_factor = self.jaco_factor(B)
 
-            if self.nvar + self.nineq == self.neq + self.nineq:
-                # Jacobian is square and full-rank
+            if B_factor is not None:
+                # Jacobian is square and full-rank, reduce problem
 
                 # calculate -Z^(-1)*g using the inverse of a block matrix
-                v01 = sym_solve(self.B_dev, self.g_dev[:self.nvar + self.nineq].reshape((self.neq + self.nineq, 1)))
-                v02 = sym_solve(self.B_dev.T, self.g_dev[self.nvar + self.nineq:].reshape((self.neq + self.nineq, 1)))
-                v03 = -Adiag * sym_solve(self.B_dev, v02)
-                Zg = aet.concatenate([v02, v01 + v03], axis=0)
+                v01 = self.lu_solve(B_factor, g_bottom, trans=1)
+                v02 = self.lu_solve(B_factor, g_top - Adiag * v01)
+                Zg = np.concatenate([v01, v02], axis=0)
+
+                if m_lbfgs > 0:
+                    # calculate -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g
+                    invB_W = self.lu_solve(B_factor, W)
+                    v11 = self.sym_solve(Minv, np.dot(W.T, Zg[:self.nvar + self.nineq]), lower=True)
+                    Zg[self.nvar + self.nineq:] += np.dot(invB_W, v11)
+            else:
+                # Jacobian is rectangular or rank-deficient
 
-                # construct U
-                W = aet.concatenate([self.zeta_dev * self.S_dev, self.Y_dev], axis=1)
+                # B = [J, 0; 0, -I] only couples the slacks through -I (see compile), and A = diag(zeta*I, A_s); every
+                # product with B^T*A^(-1) is therefore formed from the weights block J and the diagonal A_s^(-1)
+                # rather than from the dense (mostly zero) slack blocks
+                n1 = self.nvar + self.nineq
+                J = B[:self.nvar, :]
                 if self.nineq:
-                    W = aet.concatenate([W, aet.zeros((self.nineq, 2 * m_lbfgs))], axis=0)
-
-                # calculate -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g (skipped if m_lbgs=0)
-                invB_W = sym_solve(self.B_dev, W)
-                M0 = aet.concatenate([self.zeta_dev * self.SS_dev, self.L_dev], axis=1)
-                M1 = aet.concatenate([self.L_dev.T, -self.D_dev], axis=1)
-                Minv = aet.concatenate([M0, M1], axis=0)
-                v10 = aet.dot(W.T, Zg[:self.nvar + self.nineq])
-                v11 = -sym_solve(Minv, v10)
-                X10 = aet.concatenate([aet.zeros((self.nvar + self.nineq, 2 * m_lbfgs)), invB_W], axis=0)
-                XZg = aet.dot(X10, v11)
+                    inv_As = 1.0 / Adiag[self.nvar:]
 
-                # combine -Z^(-1)*g and -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g
-                dz_sqr = ifelse(aet.gt(m_lbfgs, 0), Zg - XZg, Zg)
+                # the matrix-vector and matrix-matrix products that are added to a scaled term are fused into single
+                # BLAS calls; J is C-ordered, so its transpose is handed to BLAS to avoid a Fortran-ordered copy
+                gemv, gemm = scipy.linalg.get_blas_funcs(('gemv', 'gemm'), (J,))
+                inv_zeta = 1.0 / zeta
 
-            # Jacobian is not square or is rank-deficient
+                # calculate B^T*A^(-1)*B = J^T*J/zeta + diag(0, A_s^(-1))
+                BT_invA_B = np.dot(J.T, J) / zeta
+                if self.nineq:
+                    BT_invA_B_diag_in = np.einsum('ii->i', BT_invA_B[self.neq:, self.neq:])
+                    BT_invA_B_diag_in += inv_As
 
-            # calculate some basic matrices from Z^(-1)
-            BT_invA = self.B_dev.T
-            BT_invA = aet.dot(BT_invA, diag(1.0 / Adiag.reshape((Adiag.size,))))
-            BT_invA_B = aet.dot(BT_invA, self.B_dev)
+                if self.neq:
+                    # regularize if the equality constraints Jacobian is ill-conditioned
+                    _, rcond = self.inertia(BT_invA_B[:self.neq, :self.neq])
+                    if rcond <= self.eps:
+                        BT_invA_B_diag_eq = np.einsum('ii->i', BT_invA_B[:self.neq, :self.neq])
+                        BT_invA_B_diag_eq += self.reg_shift
+
+                # B^T*A^(-1)*B is symmetric; the right-hand side for -Z^(-1)*g and the right-hand sides for B^T*U are
+                # stacked in the preallocated buffer so that a single symmetric indefinite factorization serves all of
+                # them and the solution overwrites the buffer (the slack rows of W are zero, so B^T*W = J^T*W)
+                rhs = self.lbfgs_rhs[:, :1 + 2 * m_lbfgs]
+                np.negative(g_bottom, out=rhs[:, 0])
+                gemv(inv_zeta, J.T, g_top[:self.nvar], beta=1.0, y=rhs[:, 0], overwrite_y=1)
+                if self.nineq:
+                    rhs[self.neq:, 0] -= inv_As * g_top[self.nvar:]
+                if m_lbfgs > 0:
+                    rhs[:, 1:] = np.dot(J.T, W[:self.nvar])
+                    rhs[:, 1:] /= zeta
+                X = self.sym_solve(BT_invA_B, rhs, overwrite_a=True, overwrite_b=True)
+
+                # calculate -Z^(-1)*g = [A^(-1)*(g_top - B*v), v] using the inverse of a block matrix
+                Zg = np.empty((self.nvar + 2 * self.nineq + self.neq,), dtype=self.solve_dtype)
+                Zg[n1:] = X[:, 0]
+                Zg[:self.nvar] = gemv(-inv_zeta, J.T, Zg[n1:], beta=inv_zeta, y=g_top[:self.nvar], trans=1)
+                if self.nineq:
+                    Zg[self.nvar:n1] = (g_top[self.nvar:] + Zg[n1 + self.neq:]) * inv_As
 
-            if self.neq:
-                # regularize if the equality constraints Jacobian is ill-conditioned
-                w = eigh(BT_invA_B[:self.neq, :self.neq])[0]
-                rcond = aet.min(aet.abs_(w)) / aet.max(aet.abs_(w))
-                BT_invA_B = ifelse(
-                    aet.le(rcond, self.eps),
-                    aet.inc_subtensor(BT_invA_B[:self.neq, :self.neq],
-                                    self.reg_coef * self.eta * (self.mu_dev ** self.beta) * aet.eye(self.neq)), BT_invA_B)
-
-            # calculate -Z^(-1)*g using the inverse of a block matrix
-            v00 = aet.dot(BT_invA, self.g_dev[:self.nvar + self.nineq].reshape((self.nvar + self.nineq, 1)))
-            v01 = sym_solve(BT_invA_B, v00)
-            v02 = (self.g_dev[:self.nvar + self.nineq].reshape((self.nvar + self.nineq, 1)) / Adiag -
-                   aet.dot(BT_invA.T, v01))
-            v03 = -sym_solve(BT_invA_B, self.g_dev[self.nvar + self.nineq:].reshape((self.neq + self.nineq, 1)))
-            v04 = -aet.dot(BT_invA.T, v03)
-            Zg = aet.concatenate([v02 + v04, v01 + v03], axis=0)
-
-            # construct U
-            W = aet.concatenate([self.zeta_dev * self.S_dev, self.Y_dev], axis=1)
-            if self.nineq:
-                W = aet.concatenate([W, aet.zeros((self.nineq, 2 * m_lbfgs))], axis=0)
-
-            # calculate -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g (skipped if m_lbgs=0)
-            BT_gmaW = aet.dot(self.B_dev.T, W) / self.zeta_dev
-            X00 = -sym_solve(BT_invA_B, BT_gmaW)
-            X01 = W / self.zeta_dev + aet.dot(BT_invA.T, X00)
-            X02 = aet.dot(W.T, X01)
-            M0 = aet.concatenate([self.zeta_dev * self.SS_dev, self.L_dev], axis=1)
-            M1 = aet.concatenate([self.L_dev.T, -self.D_dev], axis=1)
-            Minv = aet.concatenate([M0, M1], axis=0)
-            v10 = aet.dot(W.T, Zg[:self.nvar + self.nineq])
-            v11 = sym_solve(X02 - Minv, v10)
-            X10 = aet.concatenate([X01, -X00], axis=0)
-            XZg = aet.dot(X10, v11)
-
-            # combine -Z^(-1)*g and -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g
-            dz = ifelse(aet.gt(m_lbfgs, 0), Zg - XZg, Zg)
+                if m_lbfgs > 0:
+                    # calculate -Z^(-1)*U*(U^T*Z^(-1)*U - M)^(-1)*U^T*Z^(-1)*g
+                    X00 = -X[:, 1:]
+                    X01 = np.empty((n1, 2 * m_lbfgs), dtype=self.solve_dtype)
+                    X01[:self.nvar] = gemm(inv_zeta, J.T, X00, beta=inv_zeta, c=W[:self.nvar], trans_a=1)
+                    if self.nineq:
+                        X01[self.nvar:] = -inv_As[:, None] * X00[self.neq:]
+                    X02 = np.dot(W[:self.nvar].T, X01[:self.nvar])
+                    v11 = self.sym_solve(X02 - Minv, np.dot(W[:self.nvar].T, Zg[:self.nvar]), overwrite_a=True,
+                                         lower=True)
+                    Zg[:n1] -= np.dot(X01, v11)
+                    Zg[n1:] += np.dot(X00, v11)
+            dz = Zg
         else:
             # For unconstrained problems, calculate the search direction
             #
             #     dz = -H*g
             #
-            # where g is the gradient and the approximate inverse Hessian is
-            #                  _        _   _                                      _   _       _
-            #     H = gma*I + |_S, gma*Y_|*| R^(-T)*(D + gma*Y^T*Y)*R^(-1), -R^(-T) |*|   S^T   |
-            #                              |_             -R^(-1),               0 _| |_gma*Y^T_|
+            # where g is the gradient and H is the compact representation of the approximate inverse Hessian with
+            # initial approximation zeta*I (see [2], eq. 3.1)
+            #                              _                                     _   _          _
+            #     H = zeta*I + |S, zeta*Y|*| R^(-T)*(D + zeta*Y^T*Y)*R^(-1), -R^(-T)|*|    S^T    |
+            #                              |_           -R^(-1),               0   _| |_ zeta*Y^T_|
             #
-            #       = gma*I + W*Q*W.aet.
-            #
-            # The substitutions gma=zeta, R=L, and Y^T*Y=S^T*S are made to save variables.
-
-            # calculate -gma*I*g
-            Hg = self.zeta_dev * self.g_dev.reshape((self.nvar, 1))
-
-            # calculate -W*Q*W.T*g (skipped if m_lbfgs=0)
-            W = aet.concatenate([self.S_dev, self.zeta_dev * self.Y_dev], axis=1)
-            WT_g = aet.dot(W.T, self.g_dev)
-            B = -sym_solve(self.L_dev, WT_g[:m_lbfgs].reshape((m_lbfgs, 1)))
-            A = (-sym_solve(self.L_dev.T, aet.dot(self.D_dev + self.zeta_dev * self.SS_dev, B)) -
-                 sym_solve(self.L_dev.T, WT_g[m_lbfgs:].reshape((m_lbfgs, 1))))
-            Hg_update = aet.dot(W, aet.concatenate([A, B], axis=0))
-
-            # combine -gma*I*g and -W*Q*W.T*g
-            dz = ifelse(aet.gt(m_lbfgs, 0), Hg + Hg_update, Hg)
-
-        if self.nvar + self.nineq == self.neq + self.nineq:
-            # if constraints Jacobian is square, return both rank-deficient and full-rank search direction expressions
-            return dz, dz_sqr
-        else:
-            # if constraints Jacobian is rectangular or the problem is unconstrained, return only one expression
-            return dz, None
-
-    def lbfgs_dir(self, x, s, lda, g, zeta, S, Y, SS, L, D):
-        """Calculate the search direction for the L-BFGS algorithm.
+            # where R is the upper triangle of S^T*Y. Applying H takes a few matrix-vector products with the stored
+            # displacements and two triangular solves of size m instead of a loop over the pairs. R depends on the
+            # order of the pairs, so the products S^T*Y and Y^T*Y kept by lbfgs_update are permuted from the circular
+            # storage buffer into chronological order starting from the oldest pair at self.lbfgs_head.
+            dz = zeta * g
+            if m_lbfgs > 0:
+                order = (self.lbfgs_head + np.arange(m_lbfgs)) % m_lbfgs
+                SY = self.lbfgs_SY[:m_lbfgs, :m_lbfgs][np.ix_(order, order)]
+                YY = self.lbfgs_YY[:m_lbfgs, :m_lbfgs][np.ix_(order, order)]
+                R = np.triu(SY)
+                v = scipy.linalg.solve_triangular(R, np.dot(S, g)[order])
+                w = np.diag(SY) * v + zeta * (np.dot(YY, v) - np.dot(Y, g)[order])
+                # scatter the coefficients of the displacements back into storage order
+                coef_S = np.empty((m_lbfgs,), dtype=self.solve_dtype)
+                coef_Y = np.empty((m_lbfgs,), dtype=self.solve_dtype)
+                coef_S[order] = scipy.linalg.solve_triangular(R, w, trans='T')
+                coef_Y[order] = -zeta * v
+                dz += np.dot(coef_S, S) + np.dot(coef_Y, Y)
+
+        return dz
+
+    def jaco_factor(self, B):
+        """Return the LU factors of a square constraints Jacobian or None if
+           the Jacobian is singular to machine precision. The reciprocal
+           condition number is estimated from the LU factors themselves (?gecon)
+           instead of a separate SVD. The result is reused across iterations
+           for as long as the Jacobian does not change (e.g. when all of the
+           constraints are linear).
         """
-        # calculate the step direction
-        if self.neq or self.nineq:
-            reduce = False
-            B = self.jaco(x)
-            if B.shape[0] == B.shape[1]:
-                if np.linalg.cond(B) < 1.0 / self.eps:
-                    # B is invertible, reduce problem
-                    reduce = True
-            if reduce:
-                # if constraints Jacobian is square and full-rank
-                dz = self.lbfgs_dir_func_sqr(x, s, lda, g, zeta, S, Y, SS, L, D, B)
+        key = B.tobytes()
+        if self.jaco_factor_cache is None or self.jaco_factor_cache[0] != key:
+            try:
+                factors = self.lu_factor(B)
+            except np.linalg.LinAlgError:
+                factors = None
             else:
-                # if constraints Jacobian is rectangular or rank-deficient
-                dz = self.lbfgs_dir_func(x, s, lda, g, zeta, S, Y, SS, L, D, B)
-
-                # inefficient prototype for testing
-                # m_lbfgs = S.shape[1]
-                # H = np.zeros((self.nvar+2*self.nineq+self.neq, self.nvar+2*self.nineq+self.neq))
-                # H[:self.nvar,:self.nvar] = zeta*np.eye(self.nvar)
-                # if self.nineq:
-                #    Sigma = (lda[self.neq:]/(s+self.eps)).reshape((self.nineq,))
-                #    H[self.nvar:self.nvar+self.nineq, self.nvar:self.nvar+self.nineq] = \
-                #        np.diag(lda[self.neq:]/(s+self.eps))
-                # H[self.nvar+self.nineq:, :self.nvar+self.nineq] = B.T
-                # H[:self.nvar+self.nineq, self.nvar+self.nineq:] = B
-                #
-                # Zg_new = self.sym_solve(H, g.reshape((g.size,1)))
-                #
-                # if m_lbfgs > 0:
-                #    M0 = np.concatenate([zeta*SS, L], axis=1)
-                #    M1 = np.concatenate([L.T, -D], axis=1)
-                #    Minv = np.concatenate([M0, M1], axis=0)
-                #    W = np.concatenate([zeta*S, Y], axis=1)
-                #    H[:self.nvar, :self.nvar] = (H[:self.nvar, :self.nvar] -
-                #                                 np.dot(W, self.sym_solve(Minv,
-                #                                                          W.aet.reshape((W.size/self.nvar, self.nvar)))))
-                #
-                # dz = self.sym_solve(H, g.reshape((g.size,1)))
-        else:
-            # if problem is unconstrained
-            dz = self.lbfgs_dir_func(x, s, lda, g, zeta, S, Y, SS, L, D, None)
+                gecon, lange = scipy.linalg.get_lapack_funcs(('gecon', 'lange'), (B,))
+                rcond, _ = gecon(factors[0], lange('1', B), norm='1')
+                if rcond <= self.eps:
+                    factors = None
+            self.jaco_factor_cache = (key, factors)
+        return self.jaco_factor_cache[1]
 
-            # inefficient prototype for testing
-            # m_lbfgs = S.shape[1]
-            # H = 1.0/zeta*np.eye(self.nvar)
-            #
-            # SStrue = np.dot(S.T, S)
-            # Ltrue = np.tril(np.dot(S.T, Y), -1)
-            #
-            # if S.size > 0:
-            #    M0 = np.concatenate([1.0/zeta*SStrue, Ltrue], axis=1)
-            #    M1 = np.concatenate([Ltrue.T, -D], axis=1)
-            #    Minv = np.concatenate([M0, M1], axis=0)
-            #    W = np.concatenate([1.0/zeta*S, Y], axis=1)
-            #    H -= np.dot(W, self.sym_solve(Minv, W.aet.reshape((W.size/self.nvar, self.nvar))))
-            #
-            # dz = self.sym_solve(H, g.reshape((g.size,1)))
-
-        return dz.reshape((dz.size,))
+    @staticmethod
+    def lu_factor(M):
+        """Compute the LU factorization of M so that it may be reused to solve
+           against several right-hand sides with lu_solve.
+        """
+        getrf, = scipy.linalg.get_lapack_funcs(('getrf',), (M,))
+        lu, piv, info = getrf(M)
+        if info > 0:
+            raise np.linalg.LinAlgError('Matrix is singular.')
+        elif info < 0:
+            raise ValueError('Illegal value in argument {} of internal getrf.'.format(-info))
+        return lu, piv
 
-    def lbfgs_curv_perturb(self, dx, dg):
+    @staticmethod
+    def lu_solve(factors, b, trans=0):
+        """Solve M*x = b (trans=0) or M^T*x = b (trans=1) given the LU factors
+           of M computed by lu_factor.
+        """
+        lu, piv = factors
+        getrs, = scipy.linalg.get_lapack_funcs(('getrs',), (lu, b))
+        x, info = getrs(lu, piv, b, trans=trans)
+        if info < 0:
+            raise ValueError('Illegal value in argument {} of internal getrs.'.format(-info))
+        return x
+
+    def lbfgs_curv_perturb(self, dx, dg, x_old, x_new, g_old, g_new):
         """Perturb the curvature of the L-BFGS update when
            np.dot(dg, dx) <= 0.0 to maintain positive definiteness
            of the Hessian approximation.
         """
+        sqrt_eps = np.sqrt(self.eps)
 
         if np.dot(dg, dx) <= 0.0:
             # L-BFGS update is not positive definite, cut most negative value of the gradient displacement until it is
-            # close to zero or the update becomes positive semidefinite
+            # close to zero or the update becomes positive semidefinite; only dg[idx] changes, so the loop runs on
+            # scalars with the rest of the inner product held fixed
             idx = np.argmin(dg * dx)
-            while np.dot(dg, dx) < -np.sqrt(self.eps) and dg[idx] * dx[idx] < -np.sqrt(self.eps):
-                dg[idx] *= 0.5
-        if np.dot(dg, dx) < np.sqrt(self.eps) and (self.neq or self.nineq):
+            dg_idx = dg[idx]
+            dgx_idx = dg_idx * dx[idx]
+            dgx_rest = np.dot(dg, dx) - dgx_idx
+            while dgx_rest + dgx_idx < -sqrt_eps and dgx_idx < -sqrt_eps:
+                dg_idx *= 0.5
+                dgx_idx *= 0.5
+            dg[idx] = dg_idx
+        if np.dot(dg, dx) < sqrt_eps and (self.neq or self.nineq):
             # if the above procedure did not work, perturb the negative gradient displacements until the L-BFGS update
             # is positive definite
             dc_new = self.jaco(x_new)
             dc_old = self.jaco(x_old)
             dcc = np.dot(dc_old, g_old[self.nvar + self.nineq:]) - np.dot(dc_new, g_new[self.nvar + self.nineq:])
             self.delta = self.delta0
+            # the perturbed entries and their directions depend only on dg and dx, so they are found once and only
+            # those entries are rewritten in each iteration
+            mask = np.where(dg * dx < sqrt_eps)
+            dg_mask = dg[mask]
+            dcc_mask = np.sign(dx[mask]) * np.abs(dcc[mask])
             dg_new = np.copy(dg)
             inp = np.dot(dg_new, dx)
-            while inp < np.sqrt(self.eps) and np.linalg.norm(dg_new) > np.sqrt(self.eps) and not np.isinf(inp):
-                dg_new = np.copy(dg)
-                mask = np.where(dg_new * dx < np.sqrt(self.eps))
-                dg_new[mask] = dg[mask] + self.delta * np.sign(dx[mask]) * np.abs(dcc[mask])
+            while inp < sqrt_eps and np.linalg.norm(dg_new) > sqrt_eps and not np.isinf(inp):
+                dg_new[mask] = dg_mask + self.delta * dcc_mask
                 self.delta *= 2.0
                 inp = np.dot(dg_new, dx)
-            dg = np.copy(dg_new)
+            dg = dg_new
 
         # return the perturbed gradient displacement
         return dg
@@ -1216,7 +1478,7 @@ class IPM:
         dg = g_old[:self.nvar] - g_new[:self.nvar]
 
         # curvature perturbation (not used)
-        # dg = self.lbfgs_curv_perturb(dx, dg)
+        # dg = self.lbfgs_curv_perturb(dx, dg, x_old, x_new, g_old, g_new)
 
         # calculate updated zeta
         if self.neq or self.nineq:
@@ -1226,53 +1488,47 @@ class IPM:
         if np.dot(dx, dg) > np.sqrt(self.eps) and zeta_new > np.sqrt(self.eps):
             # if initial Hessian approximation is positive definite, update storage arrays (see [2] for definitions)
             zeta = zeta_new
-            if S.shape[1] > self.lbfgs:
-                # if S and Y exceed memory limit, remove oldest displacements
-                S[:, :-1] = S[:, 1:]
-                Y[:, :-1] = Y[:, 1:]
-                SS[:-1, :-1] = SS[1:, 1:]
-                L[:-1, :-1] = L[1:, 1:]
-                D[:-1, :-1] = D[1:, 1:]
+            if S.shape[0] > self.lbfgs:
+                # if S and Y exceed memory limit, the newest displacements overwrite the oldest ones in place; the
+                # storage arrays are used as a circular buffer whose oldest entry is at self.lbfgs_head
+                k = self.lbfgs_head
+                self.lbfgs_head = (self.lbfgs_head + 1) % S.shape[0]
             else:
-                # otherwise, expand arrays
-                lsize = S.shape[1] + 1
-                S = np.concatenate([S, np.zeros((self.nvar, 1), dtype=self.float_dtype)], axis=1)
-                Y = np.concatenate([Y, np.zeros((self.nvar, 1), dtype=self.float_dtype)], axis=1)
-                SS = np.concatenate([SS, np.zeros((1, lsize - 1), dtype=self.float_dtype)], axis=0)
-                SS = np.concatenate([SS, np.zeros((lsize, 1), dtype=self.float_dtype)], axis=1)
-                L = np.concatenate([L, np.zeros((1, lsize - 1), dtype=self.float_dtype)], axis=0)
-                L = np.concatenate([L, np.zeros((lsize, 1), dtype=self.float_dtype)], axis=1)
-                D = np.concatenate([D, np.zeros((1, lsize - 1), dtype=self.float_dtype)], axis=0)
-                D = np.concatenate([D, np.zeros((lsize, 1), dtype=self.float_dtype)], axis=1)
-
-            S[:, -1] = dx
-            Y[:, -1] = dg
-
+                # otherwise, extend the views of the preallocated storage arrays by one entry
+                lsize = S.shape[0] + 1
+                S = self.lbfgs_S[:lsize]
+                Y = self.lbfgs_Y[:lsize]
+                SS = self.lbfgs_SS[:lsize, :lsize]
+                L = self.lbfgs_L[:lsize, :lsize]
+                D = self.lbfgs_D[:lsize, :lsize]
+                k = lsize - 1
+
+            S[k] = dx
+            Y[k] = dg
+
+            # update storage arrays (the unconstrained search direction uses S^T*Y and Y^T*Y instead of SS and L, see
+            # lbfgs_dir); the stored pairs are not kept in chronological order, but since the new pair is the most
+            # recent one, its row of L holds s_k^T*y_j for every other pair j and its column of L is zero; SS is
+            # symmetric and only its lower triangle is kept
             if self.neq or self.nineq:
-                SS_update = np.dot(S.T, dx.reshape((self.nvar, 1)))
-            else:
-                # this is YY_update
-                SS_update = np.dot(Y.T, dg.reshape((self.nvar, 1)))
-
-            # update storage arrays (this is YY for unconstrained)
-            SS[:, -1] = SS_update.reshape((SS_update.size,))
-            SS[-1, :] = SS_update.reshape((SS_update.size,))
-            lsize = SS.shape[1]
-            SS = SS.reshape((lsize, lsize))
+                SS_update = np.dot(S, dx)
+                SS[k, :k + 1] = SS_update[:k + 1]
+                SS[k:, k] = SS_update[k:]
 
-            if self.neq or self.nineq:
-                L_update = np.dot(dx.reshape((1, self.nvar)), Y)
-                L[-1, :] = L_update
-                L[-1, -1] = self.float_dtype(0.0)
+                L[:, k] = 0.0
+                L[k, :] = np.dot(Y, dx)
+                L[k, k] = 0.0
             else:
-                # this is R_update and R
-                L_update = np.dot(S.T, dg.reshape((self.nvar, 1))).reshape((S.shape[1],))
-                L[:, -1] = L_update
-            L = L.reshape((lsize, lsize))
+                lsize = S.shape[0]
+                SY = self.lbfgs_SY[:lsize, :lsize]
+                SY[k, :] = np.dot(Y, dx)
+                SY[:, k] = np.dot(S, dg)
+                YY_update = np.dot(Y, dg)
+                YY = self.lbfgs_YY[:lsize, :lsize]
+                YY[k, :] = YY_update
+                YY[:, k] = YY_update
 
-            D_update = np.dot(dx, dg)
-            D[-1, -1] = D_update
-            D = D.reshape((lsize, lsize))
+            D[k, k] = np.dot(dx, dg)
 
             # reset L-BFGS failure counter
             lbfgs_fail = 0
@@ -1280,7 +1536,7 @@ class IPM:
             # increment L-BFGS failure counter
             lbfgs_fail += 1
 
-        if lbfgs_fail > self.lbfgs_fail_max and S.shape[1] > 0:
+        if lbfgs_fail > self.lbfgs_fail_max and S.shape[0] > 0:
             # if the L-BFGS fairlure counter exceeds the maximum number of failures, reset initial Hessian approximation
             # and storage arrays
             if self.verbosity > 2:
@@ -1290,75 +1546,81 @@ class IPM:
         # return initial Hessian approximation, storage arrays, and L-BFGS failure counter
         return zeta, S, Y, SS, L, D, lbfgs_fail
 
-    def reghess(self, Hc):
-        """Regularize the Hessian to avoid ill-conditioning and to escape saddle
-           points.
+    def reghess(self, Hc, g):
+        """Regularize the Hessian (in place) to avoid ill-conditioning and to
+           escape saddle points, and return the search direction dz solving
+           Hc*dz = g. Each trial Hessian is factored once; the factorization
+           that passes the inertia test also yields dz.
         """
-        # compute eigenvalues and condition number
-        w = self.eigh(Hc)
-        rcond = np.min(np.abs(w)) / np.max(np.abs(w))
+        # compute the matrix inertia and condition number
+        n_neg, rcond, dz = self.inertia(Hc, g)
 
-        if rcond <= self.eps or (self.neq + self.nineq) != np.sum(w < -self.eps):
+        if rcond <= self.eps or (self.neq + self.nineq) != n_neg:
             # if the Hessian is ill-conditioned or the matrix inertia is undesireable, regularize the Hessian
             if rcond <= self.eps and self.neq:
                 # if the Hessian is ill-conditioned, regularize by replacing some zeros with a small magnitude diagonal
                 # matrix
                 ind1 = self.nvar + self.nineq
                 ind2 = ind1 + self.neq
-                Hc[ind1:ind2, ind1:ind2] -= self.reg_coef * self.eta * (self.mu_host ** self.beta) * np.eye(self.neq)
+                Hc_diag_eq = np.einsum('ii->i', Hc[ind1:ind2, ind1:ind2])
+                Hc_diag_eq -= self.reg_shift
             if self.delta == 0.0:
                 # if the diagonal shift coefficient is zero, set to initial value
                 self.delta = self.delta0
             else:
                 # prevent the diagonal shift coefficient from becoming too small
                 self.delta = np.max([self.delta / 2, self.delta0])
-            # regularize Hessian with diagonal shift matrix (delta*I) until matrix inertia condition is satisfied
-            Hc[:self.nvar, :self.nvar] += self.delta * np.eye(self.nvar)
-            w = self.eigh(Hc)
-            while (self.neq + self.nineq) != np.sum(w < -self.eps):
-                Hc[:self.nvar, :self.nvar] -= self.delta * np.eye(self.nvar)
+            # regularize Hessian with diagonal shift matrix (delta*I) until matrix inertia condition is satisfied; the
+            # shift is applied in place through a view of the diagonal of the weights block
+            Hc_diag = np.einsum('ii->i', Hc[:self.nvar, :self.nvar])
+            Hc_diag += self.delta
+            n_neg, _, dz = self.inertia(Hc, g)
+            while (self.neq + self.nineq) != n_neg:
+                Hc_diag -= self.delta
                 self.delta *= 10.0
-                Hc[:self.nvar, :self.nvar] += self.delta * np.eye(self.nvar)
-                w = self.eigh(Hc)
+                Hc_diag += self.delta
+                n_neg, _, dz = self.inertia(Hc, g)
+
+        if dz is None:
+            raise np.linalg.LinAlgError('Matrix is singular.')
 
-        # return regularized Hessian
-        return Hc
+        # return the search direction
+        return dz
 
     def step(self, x, dx):
-        """Golden section search used to determine the maximum
-           step length for slack variables and Lagrange multipliers
-           using the fraction-to-the-boundary rule.
+        """Determine the maximum step length for slack variables and Lagrange
+           multipliers using the fraction-to-the-boundary rule,
+           x + alpha*dx >= (1 - tau)*x. For x > 0, only the components with
+           dx < 0 restrict alpha, each to alpha <= -tau*x/dx, so the largest
+           step in [0, 1] is found in closed form.
         """
-        GOLD = (np.sqrt(5.0) + 1.0) / 2.0
-
-        a = 0.0
-        b = 1.0
-        if np.all(x + b * dx >= (1.0 - self.tau) * x):
-            return b
+        mask = dx < 0.0
+        if not np.any(mask):
+            return 1.0
+        return min(1.0, np.min(-self.tau * x[mask] / dx[mask]))
+
+    def restoration_dir(self, x, c):
+        """Calculate the feasibility restoration direction dz_p solving
+           jaco(x)^T*dz_p = -c for the second-order correction in search.
+        """
+        B = self.jaco(x)
+        B_factor = None
+        if B.shape[0] == B.shape[1]:
+            # factors are only returned if B is invertible (they are shared with lbfgs_dir)
+            B_factor = self.jaco_factor(B)
+        if B_factor is not None:
+            return -self.lu_solve(B_factor, c, trans=1)
         else:
-            c = b - (b - a) / GOLD
-            d = a + (b - a) / GOLD
-            while np.abs(b - a) > GOLD * self.Xtol:
-                if np.any(x + d * dx < (1.0 - self.tau) * x):
-                    b = np.copy(d)
-                else:
-                    a = np.copy(d)
-                if c > a:
-                    if np.any(x + c * dx < (1.0 - self.tau) * x):
-                        b = np.copy(c)
-                    else:
-                        a = np.copy(c)
-
-                c = b - (b - a) / GOLD
-                d = a + (b - a) / GOLD
-
-            return a
+            # if the Jacobian is not invertible, find the minimum norm solution instead
+            return -np.linalg.lstsq(B.T, c, rcond=None)[0]
 
-    def search(self, x0, s0, lda0, dz, alpha_smax, alpha_lmax):
+    def search(self, x0, s0, lda0, dz, alpha_smax, alpha_lmax, phi0, dphi0):
         """Backtracking line search to find a solution that leads
            to a smaller value of the Lagrangian within the confines
            of the maximum step length for the slack variables and
            Lagrange multipliers found using class function 'step'.
+           phi0 and dphi0 are the merit function and its directional
+           derivative along dz at (x0, s0).
         """
         # extract search directions along x, s, and lda (weights, slacks, and multipliers)
         dx = dz[:self.nvar]
@@ -1371,35 +1633,37 @@ class IPM:
             dl = self.float_dtype(0.0)
             alpha_lmax = self.float_dtype(0.0)
 
-        x = np.copy(x0)
-        s = np.copy(s0)
-        phi0 = self.phi(x0, s0)
-        dphi0 = self.dphi(x0, s0, dz[:self.nvar + self.nineq])
+        eta_dphi0 = self.eta * dphi0
+
+        # trial points along the search direction are written in place into x and s, so each one is formed once and
+        # shared by the merit function and the constraints, and the accepted one is returned without recomputing it
+        x = np.empty_like(x0)
+        s = np.empty_like(s0)
+
+        def trial_point(alpha):
+            np.multiply(alpha, dx, out=x)
+            np.add(x, x0, out=x)
+            if self.nineq:
+                np.multiply(alpha, ds, out=s)
+                np.add(s, s0, out=s)
+
+        trial_point(alpha_smax)
         correction = False
         if self.nineq:
             # step search when there are inequality constraints
-            if self.phi(x0 + alpha_smax * dx, s0 + alpha_smax * ds) > phi0 + alpha_smax * self.eta * dphi0:
+            if self.phi(x, s) > phi0 + alpha_smax * eta_dphi0:
                 # second-order correction
                 c_old = self.con(x0, s0)
-                c_new = self.con(x0 + alpha_smax * dx, s0 + alpha_smax * ds)
+                c_new = self.con(x, s)
                 if np.sum(np.abs(c_new)) > np.sum(np.abs(c_old)):
                     # infeasibility has increased, attempt to correct
-                    A = self.jaco(x0).T
-                    try:
-                        # calculate a feasibility restoration direction
-                        dz_p = -self.sym_solve(
-                            A,
-                            c_new.reshape((self.nvar + self.nineq, 1))
-                        ).reshape((self.nvar + self.nineq,))
-                    except:
-                        # if the Jacobian is not invertible, find the minimum norm solution instead
-                        dz_p = -np.linalg.lstsq(A, c_new, rcond=None)[0]
-                    if (self.phi(x0 + alpha_smax * dx + dz_p[:self.nvar], s0 + alpha_smax * ds + dz_p[self.nvar:]) <=
-                            phi0 + alpha_smax * self.eta * dphi0):
+                    dz_p = self.restoration_dir(x0, c_new)
+                    if (self.phi(x + dz_p[:self.nvar], s + dz_p[self.nvar:]) <=
+                            phi0 + alpha_smax * eta_dphi0):
                         alpha_corr = self.step(s0, alpha_smax * ds + dz_p[self.nvar:])
                         if (self.phi(x0 + alpha_corr * (alpha_smax * dx + dz_p[:self.nvar]),
                                      s0 + alpha_corr * (alpha_smax * ds + dz_p[self.nvar:])) <=
-                                phi0 + alpha_smax * self.eta * dphi0):
+                                phi0 + alpha_smax * eta_dphi0):
                             if self.verbosity > 2:
                                 print('Second-order feasibility correction accepted')
                             # correction accepted
@@ -1408,7 +1672,8 @@ class IPM:
                     # infeasibility has not increased, no correction necessary
                     alpha_smax *= self.tau
                     alpha_lmax *= self.tau
-                    while self.phi(x0 + alpha_smax * dx, s0 + alpha_smax * ds) > phi0 + alpha_smax * self.eta * dphi0:
+                    trial_point(alpha_smax)
+                    while self.phi(x, s) > phi0 + alpha_smax * eta_dphi0:
                         # backtracking line search
                         if (np.sqrt(np.linalg.norm(alpha_smax * dx) ** 2 + np.linalg.norm(alpha_lmax * ds) ** 2) <
                                 self.eps):
@@ -1419,31 +1684,21 @@ class IPM:
                             return x0, s0, lda0
                         alpha_smax *= self.tau
                         alpha_lmax *= self.tau
-            # update slack variables
+                        trial_point(alpha_smax)
+            # update slack variables (otherwise s already holds the accepted trial point)
             if correction:
                 s = s0 + alpha_corr * (alpha_smax * ds + dz_p[self.nvar:])
-            else:
-                s = s0 + alpha_smax * ds
         else:
             # step search for only equality constraints or unconstrained problems
-            if self.phi(x0 + alpha_smax * dx, s0) > phi0 + alpha_smax * self.eta * dphi0:
+            if self.phi(x, s0) > phi0 + alpha_smax * eta_dphi0:
                 if self.neq:
                     # second-order correction
                     c_old = self.con(x0, s0)
-                    c_new = self.con(x0 + alpha_smax * dx, s0)
+                    c_new = self.con(x, s0)
                     if np.sum(np.abs(c_new)) > np.sum(np.abs(c_old)):
                         # infeasibility has increased, attempt to correct
-                        A = self.jaco(x0).T
-                        try:
-                            # calculate a feasibility restoration direction
-                            dz_p = -self.sym_solve(
-                                A,
-                                c_new.reshape((self.nvar, self.nineq, 1))
-                            ).reshape((self.nvar + self.nineq,))
-                        except:
-                            # if the Jacobian is not invertible, find the minimum norm solution instead
-                            dz_p = -np.linalg.lstsq(A, c_new, rcond=None)[0]
-                        if self.phi(x0 + alpha_smax * dx + dz_p, s0) <= phi0 + alpha_smax * self.eta * dphi0:
+                        dz_p = self.restoration_dir(x0, c_new)
+                        if self.phi(x + dz_p, s0) <= phi0 + alpha_smax * eta_dphi0:
                             # correction accepted
                             if self.verbosity > 2:
                                 print('Second-order feasibility correction accepted')
@@ -1453,7 +1708,8 @@ class IPM:
                     # infeasibility has not increased, no correction necessary
                     alpha_smax *= self.tau
                     alpha_lmax *= self.tau
-                    while self.phi(x0 + alpha_smax * dx, s0) > phi0 + alpha_smax * self.eta * dphi0:
+                    trial_point(alpha_smax)
+                    while self.phi(x, s0) > phi0 + alpha_smax * eta_dphi0:
                         # backtracking line search
                         if np.linalg.norm(alpha_smax * dx) < self.eps:
                             # search direction is unreliable to machine precision, stop solver
@@ -1463,17 +1719,16 @@ class IPM:
                             return x0, s0, lda0
                         alpha_smax *= self.tau
                         alpha_lmax *= self.tau
-        # update weights
+                        trial_point(alpha_smax)
+        # update weights (otherwise x already holds the accepted trial point)
         if correction:
             x = x0 + alpha_corr * (alpha_smax * dx + dz_p[:self.nvar])
-        else:
-            x = x0 + alpha_smax * dx
 
         # update multipliers (if applicable)
         if self.neq or self.nineq:
             lda = lda0 + alpha_lmax * dl
         else:
-            lda = np.copy(lda0)
+            lda = lda0
 
         # return updated weights, slacks, and multipliers
         return x, s, lda
@@ -1503,9 +1758,9 @@ class IPM:
         # validate class members
         self.validate()
 
-        # if expressions are not compiled or force_recompile=True, compile expressions into functions
-        if not self.compiled or force_recompile:
-            self.compile()
+        # compile expressions into functions; expressions and settings that are unchanged since an earlier solve
+        # reuse the functions compiled then unless force_recompile=True
+        self.compile(force=force_recompile)
 
         # intialize weighs, slacks, and multipliers
         x = self.x0
@@ -1518,11 +1773,16 @@ class IPM:
         else:
             s = np.array([], dtype=self.float_dtype)
             self.mu_host = self.Ktol
-            self.mu_dev.set_value(self.float_dtype(self.mu_host))
+        # the barrier parameter is left in its final state by a previous solve, so it is always reset
+        self.mu_dev.set_value(self.float_dtype(self.mu_host))
+
+        # equality constraint regularization coefficient; it only changes with the barrier parameter
+        self.reg_shift = self.reg_coef * self.eta * (self.mu_host ** self.beta)
+
+        self.nu_host = self.float_dtype(self.nu)
+        self.nu_dev.set_value(self.nu_host)
 
         if self.neq or self.nineq:
-            self.nu_host = self.nu
-            self.nu_dev.set_value(self.float_dtype(self.nu_host))
             if self.lda0 is None:
                 lda = self.init_lambda(x)
                 if self.nineq and self.neq:
@@ -1539,14 +1799,15 @@ class IPM:
         # initialize diagonal shift coefficient
         self.delta = self.float_dtype(0.0)
 
-        # calculate the initial KKT conditions
-        kkt = self.KKT(x, s, lda)
+        # calculate the initial gradient (and Hessian, if applicable) and KKT conditions
+        grad, H = self.grad_hess(x, s, lda)
+        g = -grad
+        kkt = self.KKT(x, s, lda, kkts=grad)
 
         if self.lbfgs:
-            # if using L-BFGS algorithm, initialize Hessian approximation, storage arrays, prior weights, and gradient
+            # if using L-BFGS algorithm, initialize Hessian approximation, storage arrays, and prior weights
             zeta, S, Y, SS, L, D, lbfgs_fail = self.lbfgs_init()
-            x_old = np.copy(x)
-            g = -self.grad(x, s, lda)
+            x_old = x
 
         if self.verbosity > 0:
             if self.lbfgs:
@@ -1570,8 +1831,7 @@ class IPM:
 
             # determine if the current point has converged to Ktol precision using KKT conditions; if True, solution
             # found
-            if all([np.linalg.norm(kkt[0]) <= self.Ktol, np.linalg.norm(kkt[1]) <= self.Ktol,
-                    np.linalg.norm(kkt[2]) <= self.Ktol, np.linalg.norm(kkt[3]) <= self.Ktol]):
+            if self.kkt_converged(kkt, self.Ktol):
                 self.signal = 1
                 Ktol_converged = True
                 break
@@ -1584,8 +1844,7 @@ class IPM:
 
                 # check convergence to muTol precision using the KKT conditions; if True, break from the inner loop
                 muTol = np.max([self.Ktol, self.mu_host])
-                if all([np.linalg.norm(kkt[0]) <= muTol, np.linalg.norm(kkt[1]) <= muTol,
-                        np.linalg.norm(kkt[2]) <= muTol, np.linalg.norm(kkt[3]) <= muTol]):
+                if self.kkt_converged(kkt, muTol):
                     if not self.neq and not self.nineq:
                         self.signal = 1
                         Ktol_converged = True
@@ -1607,53 +1866,59 @@ class IPM:
                     print(', '.join(msg))
 
                 if self.lbfgs:
-                    # if using the L-BFGS algorithm, calculate the new and prior gradients and weights and update
-                    # storage arrays
+                    # if using the L-BFGS algorithm, calculate the prior gradient and weights and update storage arrays
                     if inner > 0 or outer > 0:
                         g_old = -self.grad(x_old, s, lda)
-                        g_new = -self.grad(x, s, lda)
-                        zeta, S, Y, SS, L, D, lbfgs_fail = self.lbfgs_update(x_old, x, g_old, g_new, zeta, S, Y, SS, L,
+                        zeta, S, Y, SS, L, D, lbfgs_fail = self.lbfgs_update(x_old, x, g_old, g, zeta, S, Y, SS, L,
                                                                              D, lbfgs_fail)
-                        x_old = np.copy(x)
-                        g = np.copy(g_new)
+                        # search returns newly allocated weights, so the current ones can be kept without a copy
+                        x_old = x
                     # calculate the search direction
                     dz = self.lbfgs_dir(x, s, lda, g, zeta, S, Y, SS, L, D)
                 else:
-                    # calculate the gradient and Hessian and regularize the Hessian if necessary to maintain appropriate
-                    # matrix inertia
-                    g = -self.grad(x, s, lda)
-                    Hc = self.reghess(self.hess(x, s, lda))
-                    # calculate the search direction
-                    dz = self.sym_solve(Hc, g.reshape((g.size, 1))).reshape((g.size,))
+                    # regularize the Hessian if necessary to maintain appropriate matrix inertia and calculate the
+                    # search direction
+                    dz = self.reghess(H, g)
+                # the search direction may have been computed in higher precision (see mixed_precision)
+                dz = dz.astype(self.float_dtype, copy=False)
 
                 if self.neq or self.nineq:
                     # change sign definition for the multipliers' search direction
                     dz[self.nvar + self.nineq:] = -dz[self.nvar + self.nineq:]
 
+                # evaluate the barrier cost, its gradient, and the l1 norm of the constraint violations in one call;
+                # they determine the merit function parameter as well as the merit function and its directional
+                # derivative at the start of the line search
+                bar_cost, bar_cost_grad, con_l1 = self.merit_terms(x, s)
+                dbar_cost = np.dot(bar_cost_grad, dz[:self.nvar + self.nineq])
+
                 if self.neq or self.nineq:
                     # update the merit function parameter, if necessary
-                    nu_thres = np.dot(
-                        self.barrier_cost_grad(x, s),
-                        dz[:self.nvar + self.nineq]
-                    ) / (1 - self.rho) / np.sum(np.abs(self.con(x, s)))
+                    nu_thres = dbar_cost / (1 - self.rho) / con_l1
                     if self.nu_host < nu_thres:
                         self.nu_host = self.float_dtype(nu_thres)
                         self.nu_dev.set_value(self.nu_host)
 
+                phi0 = bar_cost + self.nu_host * con_l1
+                dphi0 = dbar_cost - self.nu_host * con_l1
+
                 if self.nineq:
                     # use fraction-to-the-boundary rule to make sure slacks and multipliers do not decrease too quickly
                     alpha_smax = self.step(s, dz[self.nvar:(self.nvar + self.nineq)])
                     alpha_lmax = self.step(lda[self.neq:], dz[(self.nvar + self.nineq + self.neq):])
                     # use a backtracking line search to update weights, slacks, and multipliers
-                    x, s, lda = self.search(x, s, lda, dz, self.float_dtype(alpha_smax), self.float_dtype(alpha_lmax))
+                    x, s, lda = self.search(x, s, lda, dz, self.float_dtype(alpha_smax), self.float_dtype(alpha_lmax),
+                                            phi0, dphi0)
                 else:
                     # use a backtracking line search to update weights, slacks, and multipliers
-                    x, s, lda = self.search(x, s, lda, dz, self.float_dtype(1.0), self.float_dtype(1.0))
+                    x, s, lda = self.search(x, s, lda, dz, self.float_dtype(1.0), self.float_dtype(1.0), phi0, dphi0)
 
                 iter_count += 1
 
-                # calculate the updated KKT conditions
-                kkt = self.KKT(x, s, lda)
+                # calculate the updated gradient (and Hessian, if applicable) and KKT conditions
+                grad, H = self.grad_hess(x, s, lda)
+                g = -grad
+                kkt = self.KKT(x, s, lda, kkts=grad)
 
                 if all([self.Ftol is not None, not self.nineq, self.signal != -2]):
                     # for unconstrained and equality constraints only, calculate new cost and check Ftol convergence
@@ -1705,13 +1970,16 @@ class IPM:
 
             if self.nineq:
                 # update the barrier parameter
-                xi = self.nineq * np.min(s * lda[self.neq:]) / (np.dot(s, lda[self.neq:]) + self.eps)
-                self.mu_host = (0.1 * np.min([0.05 * (1.0 - xi) / (xi + self.eps), 2.0]) ** 3 *
-                                np.dot(s, lda[self.neq:]) / self.nineq)
-                if self.float_dtype(self.mu_host) < self.float_dtype(0.0):
-                    self.mu_host = 0.0
-                self.mu_host = self.float_dtype(self.mu_host)
+                sl = s * lda[self.neq:]
+                sl_sum = sl.sum()
+                xi = self.nineq * sl.min() / (sl_sum + self.eps)
+                self.mu_host = self.float_dtype(max(
+                    0.1 * min(0.05 * (1.0 - xi) / (xi + self.eps), 2.0) ** 3 * sl_sum / self.nineq, 0.0))
                 self.mu_dev.set_value(self.mu_host)
+                self.reg_shift = self.reg_coef * self.eta * (self.mu_host ** self.beta)
+
+                # the gradient with respect to the slacks depends on the barrier parameter
+                g = -self.grad(x, s, lda)
 
         # assign class member variables to the solutions
         self.x = x
@@ -1724,8 +1992,7 @@ class IPM:
             msg = []
             if self.signal == -2:
                 msg.append('Terminated due to bad direction in backtracking line search')
-            elif all([np.linalg.norm(kkt[0]) <= self.Ktol, np.linalg.norm(kkt[1]) <= self.Ktol,
-                      np.linalg.norm(kkt[2]) <= self.Ktol, np.linalg.norm(kkt[3]) <= self.Ktol]):
+            elif self.kkt_converged(kkt, self.Ktol):
                 msg.append('Converged to Ktol tolerance')
             elif self.Ftol is not None and Ftol_converged:
                 msg.append('Converged to Ftol tolerance')
@@ -1762,256 +2029,360 @@ class IPM:
         return self.x, self.s, self.lda, self.fval, self.kkt
 
 
-def main():
-    import sys
-    import os
-
-    def list2str(lst):
-        return [str(l) for l in lst]
+_solver_cache = {}
 
-    # This main function provides example problems that may be used to help users write their code
-    # (and to make sure modifications to IPM do not break the code). To call these test problems,
-    # use command line arguments; e.g.
-    #
-    #     python pyipm.py 5
-    #
-    # to run the 5th problem. There are 10 problems total called by arguments 1-10.
-
-    # To use L-BFGS to approximate the Hessian, set lbfgs to a positive integer to define the
-    # number of iterations to store to make the Hessian approximation. Otherwise, set lbfgs to
-    # False or 0.
-    lbfgs = False
-
-    # The verbosity level between from -1 up to 3 determines the amount of feedback the algorithm
-    # gives to the user during the optimization.
-    verbosity = 1
 
-    # Setting Ftol (the function tolerance) can be a helpful secondary criteria for convergence;
-    # by default, Ftol is unset and only Ktol is used (the KKT conditions tolerance).
-    # E.g. on occasion, L-BFGS may converge slowly on the Rosenbrock example so Ftol=1.0E-8 can
-    # be used as a safeguard.
-    Ftol = 1.0E-8
+def _cached_solver(key, **kwargs):
+    """Return the example solver stored under key, constructing it from kwargs (see IPM) on the
+       first call. Later calls reuse the compiled solver and the expressions passed in kwargs are
+       ignored.
+    """
+    if key not in _solver_cache:
+        _solver_cache[key] = IPM(**kwargs)
+    return _solver_cache[key]
+
+
+def _scipy_solve(x0, x_dev, f, df=None, ce=None, dce=None, ci=None, dci=None, verbosity=1, **kwargs):
+    """Solve an example problem with scipy.optimize.minimize (method='trust-constr') instead of IPM.
+       The arguments follow IPM, except that second derivatives (and any other IPM settings passed in
+       kwargs) are ignored; SciPy approximates the Hessian with BFGS updates. Each aesara expression
+       is compiled into a single NumPy callable once and missing derivatives are taken symbolically.
+       Returns the same tuple as IPM.solve, where s are the inequality constraints at the solution,
+       lda the Lagrange multipliers in IPM's sign convention, and kkt is None.
+    """
+    import scipy.optimize
+    import warnings
+
+    def compile_fn(expr):
+        if callable(expr):
+            return expr
+        fn = aesara.function([x_dev], expr, allow_input_downcast=True)
+        return lambda x: np.asarray(fn(x), dtype=np.float64)
+
+    if df is None:
+        df = aesara.grad(f, x_dev)
+    f_fn = compile_fn(f)
+    df_fn = compile_fn(df)
+
+    constraints = []
+    for kind, c, dc in (('eq', ce, dce), ('ineq', ci, dci)):
+        if c is None:
+            continue
+        if dc is None:
+            # IPM's derivative functions return the transposed Jacobian
+            dc = aesara.gradient.jacobian(c, x_dev).T if c.ndim else aesara.grad(c, x_dev).reshape((-1, 1))
+        c_fn = compile_fn(c)
+        dc_fn = compile_fn(dc)
+        constraints.append({'type': kind, 'fun': lambda x, c_fn=c_fn: np.atleast_1d(c_fn(x)),
+                            'jac': lambda x, dc_fn=dc_fn: np.atleast_2d(dc_fn(x)).T})
+
+    with warnings.catch_warnings():
+        # BFGS warns about skipped updates on problems with linear objectives or constraints
+        warnings.filterwarnings('ignore', message='delta_grad == 0.0')
+        res = scipy.optimize.minimize(f_fn, np.asarray(x0, dtype=np.float64), jac=df_fn, method='trust-constr',
+                                      hess=scipy.optimize.BFGS(), constraints=constraints,
+                                      options={'verbose': max(0, min(verbosity, 2))})
+
+    x = res.x.astype(x0.dtype)
+    s = constraints[-1]['fun'](res.x).astype(x0.dtype) if ci is not None else None
+    # trust-constr defines the Lagrangian as f + v^T*c while IPM uses f - lda^T*c
+    lda = -np.concatenate(res.v).astype(x0.dtype) if constraints else None
+    return x, s, lda, x0.dtype.type(res.fun), None
+
+
+def _report(var, gt, x, fval, s=None, lda=None):
+    """Print the ground truth of an example problem next to the solver solution. var labels the
+       weights (e.g. '[x, y]'); gt is either the ground truth weights or a string describing them.
+       The slack variables and Lagrange multipliers are printed if given.
+    """
+    def fmt(v):
+        return np.array2string(np.asarray(v), precision=8, separator=', ', threshold=np.inf)
 
+    print('')
+    if isinstance(gt, str):
+        print('Ground truth: {}'.format(gt))
+    else:
+        print('Ground truth: {} = {}'.format(var, fmt(gt)))
+    print('Solver solution: {} = {}'.format(var, fmt(x)))
+    if s is not None:
+        print('Slack variables: s = {}'.format(fmt(s)))
+    if lda is not None:
+        print('Lagrange multipliers: lda = {}'.format(fmt(lda)))
+    print('f({}) = {}'.format(var.strip('[]'), fval))
+
+
+def example(prob, float_dtype=np.float64, lbfgs=False, Ftol=None, verbosity=1, use_scipy=False, seed=None):
+    """Solve the example problem numbered prob (1 through 10) and print the solution alongside the
+       ground truth. seed (an integer, a np.random.SeedSequence, or None) seeds the generator of the
+       starting point. See main for a description of the other arguments.
+    """
     # x_dev is a device vector that must be predefined by the user and is used to build aesara
     # expressions.
     x_dev = aet.vector('x_dev')
 
-    # get the problem number from the command line argument list.
-    prob = int(sys.argv[1])
+    # the starting point is drawn from a generator of its own, so a given seed reproduces the same
+    # starting point whether the problem runs alone or in a worker process alongside others
+    rng = np.random.default_rng(seed)
 
-    # determine the floating-point type from the 'aesara_FLAGS' environment variable.
-    float_dtype = os.environ.get('aesara_FLAGS')
-    if float_dtype is not None:
-        try:
-            float_dtype = float_dtype.split('floatX=')[1]
-        except IndexError:
-            raise Exception('Error: attribute "floatX" not defined in "aesara_FLAGS" environment variable.')
-        float_dtype = float_dtype.split(',')[0]
-    else:
-        raise Exception('Error: "aesara_FLAGS" environment variable is unset.')
-    if float_dtype.strip() == 'float32':
-        float_dtype = np.float32
-    else:
-        float_dtype = np.float64
+    # solvers are cached by problem and settings, so running a problem again with another seed only
+    # draws a new starting point instead of recompiling its aesara functions; note that the
+    # expressions built below are therefore only used the first time a problem is run with the
+    # given settings, and expressions passed on later calls are silently ignored
+    key = (prob, np.dtype(float_dtype).name, lbfgs, Ftol, verbosity)
+
+    def _run(x0, f, **kwargs):
+        # solve from x0 with the (cached) solver for f and the problem specific arguments in kwargs
+        if use_scipy:
+            return _scipy_solve(x0, x_dev, f, verbosity=verbosity, **kwargs)
+        p = _cached_solver(key, x0=x0, x_dev=x_dev, f=f, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype,
+                           verbosity=verbosity, **kwargs)
+        return p.solve(x0=x0)
 
     # example problem definitions
     if prob == 1:
         print('minimize f(x, y) = x**2 - 4*x + y**2 - y - x*y')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = x_dev[0] ** 2 - 4 * x_dev[0] + x_dev[1] ** 2 - x_dev[1] - x_dev[0] * x_dev[1]
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f)
 
-        gt = [float_dtype(3.0), float_dtype(2.0)]
-        print('')
-        print('Ground truth: [x, y] = [{}, {}]'.format(*gt))
-        print('Solver solution: [x, y] = [{}, {}]'.format(*x))
-        print('f(x, y) = {}'.format(fval))
+        _report('[x, y]', [3.0, 2.0], x, fval)
     elif prob == 2:
         print('Find the global minimum of the 2D Rosenbrock function.')
         print('minimize f(x, y) = 100*(y - x**2)**2 + (1 - x)**2')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = 100 * (x_dev[1] - x_dev[0] ** 2) ** 2 + (1 - x_dev[0]) ** 2
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f)
 
-        gt = [float_dtype(1.0), float_dtype(1.0)]
-        print('')
-        print('Ground truth: [x, y] = [{}, {}]'.format(*gt))
-        print('Solver solution: [{}, {}]'.format(*x))
-        print('f(x, y) = {}'.format(fval))
+        _report('[x, y]', [1.0, 1.0], x, fval)
     elif prob == 3:
         print('maximize f(x, y) = x + y subject to x**2 + y**2 = 1')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = -aet.sum(x_dev)
         ce = aet.sum(x_dev ** 2) - 1.0
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ce=ce)
 
-        gt = [float_dtype(np.sqrt(2.0) / 2.0), float_dtype(np.sqrt(2.0) / 2.0)]
-        print('')
-        print('Ground truth: [x, y] = [{}, {}]'.format(*gt))
-        print('Solver solution: [x, y] = [{}, {}]'.format(*x))
-        print('Lagrange multiplier: lda = {}'.format(lda))
-        print('f(x, y) = {}'.format(-fval))
+        _report('[x, y]', [np.sqrt(2.0) / 2.0] * 2, x, -fval, lda=lda)
     elif prob == 4:
         print('maximize f(x, y) = (x**2)*y subject to x**2 + y**2 = 3')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = -(x_dev[0] ** 2) * x_dev[1]
         ce = aet.sum(x_dev ** 2) - 3.0
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ce=ce)
 
-        gt = [
-            float_dtype(np.sqrt(2.0)), float_dtype(1.0),
-            -float_dtype(np.sqrt(2.0)), float_dtype(1.0),
-            float_dtype(0.0), -float_dtype(-np.sqrt(3.0)),
-        ]
-        print('')
-        print('Ground truth: global max. @ [x, y] = [{}, {}] or [{}, {}], local max. @ [{}, {}]'.format(*gt))
-        print('Solver solution: [x, y] = [{}, {}]'.format(*x))
-        print('Lagrange multipler: lda = {}'.format(lda))
-        print('f(x, y) = {}'.format(-fval))
+        gt = 'global max. @ [x, y] = [{}, {}] or [{}, {}], local max. @ [{}, {}]'.format(
+            np.sqrt(2.0), 1.0, -np.sqrt(2.0), 1.0, 0.0, np.sqrt(3.0))
+        _report('[x, y]', gt, x, -fval, lda=lda)
     elif prob == 5:
         print('minimize f(x, y) = x**2 + 2*y**2 + 2*x + 8*y subject to -x - 2*y + 10 <= 0, x >= 0, y >= 0')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = x_dev[0] ** 2 + 2.0 * x_dev[1] ** 2 + 2.0 * x_dev[0] + 8.0 * x_dev[1]
-        ci = aet.zeros((3,))
-        ci = aet.set_subtensor(ci[0], x_dev[0] + 2.0 * x_dev[1] - 10.0)
-        ci = aet.set_subtensor(ci[1], x_dev[0])
-        ci = aet.set_subtensor(ci[2], x_dev[1])
+        ci = aet.stack([x_dev[0] + 2.0 * x_dev[1] - 10.0, x_dev[0], x_dev[1]])
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ci=ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ci=ci)
 
-        gt = [float_dtype(4.0), float_dtype(3.0)]
-        print('')
-        print('Ground truth: [x, y] = [{}, {}]'.format(*gt))
-        print('Solver solution: [x, y] = [{}, {}]'.format(*x))
-        print('Slack variables: s = [{}, {}, {}]'.format(-s[0], s[1], s[2]))
-        print('Lagrange multipliers: lda = [{}, {}, {}]'.format(-lda[0], lda[1], lda[2]))
-        print('f(x, y) = {}'.format(fval))
+        sign = np.array([-1.0, 1.0, 1.0])
+        _report('[x, y]', [4.0, 3.0], x, fval, s=sign * s, lda=sign * lda)
     elif prob == 6:
         print('Find the maximum entropy distribution of a six-sided die:')
         print('maximize f(x) = -sum(x*log(x)) subject to sum(x) = 1 and x >= 0 (x.size == 6)')
         print('')
-        x0 = np.random.rand(6).astype(float_dtype)
+        x0 = rng.random(6, dtype=float_dtype)
         x0 = x0 / np.sum(x0)
 
         f = aet.sum(x_dev * aet.log(x_dev + np.finfo(float_dtype).eps))
         ce = aet.sum(x_dev) - 1.0
         ci = 1.0 * x_dev
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, ci=ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype,
-                verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ce=ce, ci=ci)
 
-        gt = str(float_dtype(1.0 / 6.0))
-        print('')
-        print('Ground truth: [{}]'.format(', '.join([gt] * 6)))
-        print('Solver solution: x = [{}]'.format(', '.join(list2str(x))))
-        print('Slack variables: s = [{}]'.format(', '.join(list2str(s))))
-        print('Lagrange multipliers: lda = [{}]'.format(', '.join(list2str(lda))))
-        print('f(x) = {}'.format(-fval))
+        _report('x', [1.0 / 6.0] * 6, x, -fval, s=s, lda=lda)
     elif prob == 7:
         print('maximize f(x, y, z) = x*y*z subject to x + y + z = 1, x >= 0, y >= 0, z >= 0')
         print('')
-        x0 = np.random.randn(3).astype(float_dtype)
+        x0 = rng.standard_normal(3, dtype=float_dtype)
 
         f = -x_dev[0] * x_dev[1] * x_dev[2]
         ce = aet.sum(x_dev) - 1.0
         ci = 1.0 * x_dev
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, ci=ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype,
-                verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        # the derivatives are simple enough to write out by hand as NumPy functions, which skips
+        # building and compiling their aesara graphs
+        df = lambda x: -np.array([x[1] * x[2], x[0] * x[2], x[0] * x[1]])
+        dce = lambda x: np.ones((3, 1), dtype=x.dtype)
+        dci = lambda x: np.eye(3, dtype=x.dtype)
+        if lbfgs:
+            d2f = d2ce = d2ci = None
+        else:
+            d2f = lambda x: -np.array([[0.0, x[2], x[1]], [x[2], 0.0, x[0]], [x[1], x[0], 0.0]], dtype=x.dtype)
+            d2ce = lambda x, lda: np.zeros((3, 3), dtype=x.dtype)
+            d2ci = lambda x, lda: np.zeros((3, 3), dtype=x.dtype)
 
-        gt = [float_dtype(1.0 / 3.0), float_dtype(1.0 / 3.0), float_dtype(1.0 / 3.0)]
-        print('')
-        print('Ground truth: [x, y, z] = [{}, {}, {}]'.format(*gt))
-        print('Solver solution: [x, y, z] = [{}, {}, {}]'.format(*x))
-        print('Slack variables: s = [{}, {}, {}]'.format(*s))
-        print('Lagrange multipliers: lda = [{}, {}, {}, {}]'.format(*lda))
-        print('f(x, y, z) = {}'.format(-fval))
+        x, s, lda, fval, kkt = _run(x0, f, df=df, d2f=d2f, ce=ce, dce=dce, d2ce=d2ce, ci=ci, dci=dci, d2ci=d2ci)
+
+        _report('[x, y, z]', [1.0 / 3.0] * 3, x, -fval, s=s, lda=lda)
     elif prob == 8:
         print('minimize f(x,y,z) = 4*x - 2*z subject to 2*x - y - z = 2, x**2 + y**2 = 1')
         print('')
-        x0 = np.random.randn(3).astype(float_dtype)
+        x0 = rng.standard_normal(3, dtype=float_dtype)
 
         f = 4.0 * x_dev[1] - 2.0 * x_dev[2]
-        ce = aet.zeros((2,))
-        ce = aet.set_subtensor(ce[0], 2.0 * x_dev[0] - x_dev[1] - x_dev[2] - 2.0)
-        ce = aet.set_subtensor(ce[1], x_dev[0] ** 2 + x_dev[1] ** 2 - 1.0)
-
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
-
-        gt = [
-            float_dtype(2.0 / np.sqrt(13.0)),
-            float_dtype(-3.0 / np.sqrt(13.0)),
-            float_dtype(-2.0 + 7.0 / np.sqrt(13.0))
-        ]
-        print('')
-        print('Ground truth: [x, y, z] = [{}, {}, {}]'.format(*gt))
-        print('Solver solution: [x, y, z] = [{}, {}, {}]'.format(*x))
-        print('Lagrange multipliers: lda = [{}, {}]'.format(*lda))
-        print('f(x, y, z) = {}'.format(fval))
+        ce = aet.stack([2.0 * x_dev[0] - x_dev[1] - x_dev[2] - 2.0, x_dev[0] ** 2 + x_dev[1] ** 2 - 1.0])
+
+        # hand-written derivatives (see problem 7); f is linear, so its gradient and Hessian are
+        # constant arrays that are allocated once
+        df_const = np.array([0.0, 4.0, -2.0], dtype=float_dtype)
+        df = lambda x: df_const
+        dce = lambda x: np.array([[2.0, 2.0 * x[0]], [-1.0, 2.0 * x[1]], [-1.0, 0.0]], dtype=x.dtype)
+        if lbfgs:
+            d2f = d2ce = None
+        else:
+            d2f_const = np.zeros((3, 3), dtype=float_dtype)
+            d2f = lambda x: d2f_const
+            d2ce = lambda x, lda: np.diag(np.array([2.0, 2.0, 0.0], dtype=x.dtype) * lda[1])
+
+        x, s, lda, fval, kkt = _run(x0, f, df=df, d2f=d2f, ce=ce, dce=dce, d2ce=d2ce)
+
+        gt = [2.0 / np.sqrt(13.0), -3.0 / np.sqrt(13.0), -2.0 + 7.0 / np.sqrt(13.0)]
+        _report('[x, y, z]', gt, x, fval, lda=lda)
     elif prob == 9:
         print('minimize f(x, y) = (x - 2)**2 + 2*(y - 1)**2 subject to x + 4*y <= 3, x >= y')
         print('')
-        x0 = np.random.randn(2).astype(float_dtype)
+        x0 = rng.standard_normal(2, dtype=float_dtype)
 
         f = (x_dev[0] - 2.0) ** 2 + 2.0 * (x_dev[1] - 1.0) ** 2
-        ci = aet.zeros(2)
-        ci = aet.set_subtensor(ci[0], -x_dev[0] - 4.0 * x_dev[1] + 3.0)
-        ci = aet.set_subtensor(ci[1], x_dev[0] - x_dev[1])
+        ci = aet.stack([-x_dev[0] - 4.0 * x_dev[1] + 3.0, x_dev[0] - x_dev[1]])
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ci=ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ci=ci)
 
-        gt = [float_dtype(5.0 / 3.0), float_dtype(1.0 / 3.0)]
-        print('')
-        print('Ground truth: [x, y] = [{}, {}]'.format(*gt))
-        print('Solver solution: [x, y] = [{}, {}]'.format(*x))
-        print('Slack variables: s = [{}, {}]'.format(-s[0], s[1]))
-        print('Lagrange multipliers: lda = [{}, {}]'.format(-lda[0], lda[1]))
-        print('f(x, y) = {}'.format(fval))
+        sign = np.array([-1.0, 1.0])
+        _report('[x, y]', [5.0 / 3.0, 1.0 / 3.0], x, fval, s=sign * s, lda=sign * lda)
     elif prob == 10:
         print('minimize f(x, y, z) = (x - 1)**2 + 2*(y + 2)**2 + 3*(z + 3)**2 subject to z - y - x = 1, z - x**2 >= 0')
         print('')
-        x0 = np.random.randn(3).astype(float_dtype)
+        x0 = rng.standard_normal(3, dtype=float_dtype)
 
         f = (x_dev[0] - 1.0) ** 2 + 2.0 * (x_dev[1] + 2.0) ** 2 + 3.0 * (x_dev[2] + 3.0) ** 2
         ce = x_dev[2] - x_dev[1] - x_dev[0] - 1.0
         ci = x_dev[2] - x_dev[0] ** 2
 
-        p = IPM(x0=x0, x_dev=x_dev, f=f, ce=ce, ci=ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype,
-                verbosity=verbosity)
-        x, s, lda, fval, kkt = p.solve()
+        x, s, lda, fval, kkt = _run(x0, f, ce=ce, ci=ci)
+
+        _report('[x, y, z]', [0.12288, -1.1078, 0.015100], x, fval, s=s, lda=lda)
+
+    if kkt is not None:
+        print('Karush-Kuhn-Tucker conditions (up to a sign):\n{}'.format(kkt))
 
-        gt = [0.12288, -1.1078, 0.015100]
-        print('')
-        print('Ground truth: [x, y, z] = [{}, {}, {}]'.format(*gt))
-        print('Solver solution: [x, y, z] = [{}, {}, {}]'.format(*x))
-        print('Slack variable: s = {}'.format(s))
-        print('Lagrange multipliers: lda = [{}, {}]'.format(*lda))
-        print('f(x, y) = {}'.format(fval))
 
-    print('Karush-Kuhn-Tucker conditions (up to a sign):\n{}'.format(kkt))
+def _example_output(args_list):
+    """Run example(*args) for each args in args_list and return a list of everything each run
+       prints instead of printing it; used by main to run examples in worker processes without
+       interleaving their output.
+    """
+    import contextlib
+    import io
+
+    outputs = []
+    for args in args_list:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            example(*args)
+        outputs.append(out.getvalue())
+    return outputs
+
+
+def main():
+    import concurrent.futures
+    import sys
+    import os
+
+    # This main function provides example problems that may be used to help users write their code
+    # (and to make sure modifications to IPM do not break the code). To call these test problems,
+    # use command line arguments; e.g.
+    #
+    #     python pyipm.py 5
+    #
+    # to run the 5th problem. There are 10 problems total called by arguments 1-10. Several
+    # problems may be run in one call, e.g.
+    #
+    #     python pyipm.py 1 3 5
+    #
+    # in which case the problems are solved in parallel worker processes and their output is
+    # printed in order once they finish. Repeated runs of the same problem (e.g. 'python pyipm.py
+    # 7 7') share a worker, so that they also share its compiled solver.
+
+    # To use L-BFGS to approximate the Hessian, set lbfgs to a positive integer to define the
+    # number of iterations to store to make the Hessian approximation. Otherwise, set lbfgs to
+    # False or 0.
+    lbfgs = False
+
+    # The verbosity level between from -1 up to 3 determines the amount of feedback the algorithm
+    # gives to the user during the optimization.
+    verbosity = 1
+
+    # Setting Ftol (the function tolerance) can be a helpful secondary criteria for convergence;
+    # by default, Ftol is unset and only Ktol is used (the KKT conditions tolerance).
+    # E.g. on occasion, L-BFGS may converge slowly on the Rosenbrock example so Ftol=1.0E-8 can
+    # be used as a safeguard.
+    Ftol = 1.0E-8
+
+    # Set use_scipy to True to solve the examples with scipy.optimize.minimize (trust-constr)
+    # instead of IPM, e.g. to compare the solutions; the Hessian is then approximated with BFGS
+    # updates and lbfgs and Ftol are ignored.
+    use_scipy = False
+
+    # The starting points are drawn at random. Set seed to an integer to reproduce them from run to
+    # run (e.g. when timing changes to the solver) or to None to draw new ones on every run. Each
+    # problem run is given its own child seed, so repeated runs of a problem start from different
+    # points.
+    seed = 0
+
+    # get the problem numbers from the command line argument list.
+    probs = [int(arg) for arg in sys.argv[1:]]
+
+    # determine the floating-point type from the 'aesara_FLAGS' environment variable.
+    float_dtype = os.environ.get('aesara_FLAGS')
+    if float_dtype is not None:
+        try:
+            float_dtype = float_dtype.split('floatX=')[1]
+        except IndexError:
+            raise Exception('Error: attribute "floatX" not defined in "aesara_FLAGS" environment variable.')
+        float_dtype = float_dtype.split(',')[0]
+    else:
+        raise Exception('Error: "aesara_FLAGS" environment variable is unset.')
+    if float_dtype.strip() == 'float32':
+        float_dtype = np.float32
+    else:
+        float_dtype = np.float64
+
+    # spawn one child seed per run so that the starting points do not depend on which worker runs them
+    seeds = np.random.SeedSequence(seed).spawn(len(probs))
+
+    # each distinct problem is assigned to one worker, which runs all of its repetitions
+    distinct = list(dict.fromkeys(probs))
+    if len(distinct) > 1:
+        args = [[(prob, float_dtype, lbfgs, Ftol, verbosity, use_scipy, run_seed)
+                 for p, run_seed in zip(probs, seeds) if p == prob] for prob in distinct]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(distinct), os.cpu_count())) as executor:
+            outputs = dict(zip(distinct, (iter(out) for out in executor.map(_example_output, args))))
+        print('\n'.join(next(outputs[prob]) for prob in probs), end='')
+    else:
+        for prob, run_seed in zip(probs, seeds):
+            example(prob, float_dtype=float_dtype, lbfgs=lbfgs, Ftol=Ftol, verbosity=verbosity, use_scipy=use_scipy,
+                    seed=run_seed)
 
 
 if __name__ == '__main__':
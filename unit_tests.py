@@ -3,8 +3,14 @@ from __future__ import print_function
 import aesara
 import aesara.tensor as aet
 import numpy as np
+import pyipm
 from pyipm import IPM
 
+try:
+    import jax
+except ImportError:
+    jax = None
+
 
 # text abbreviations for:
 #    f: objective function
@@ -41,6 +47,16 @@ def make_text_state(state, m):
     return '|'.join(string)
 
 
+def check(passed, test_results):
+    if not passed:
+        test_results.append(False)
+        raise Exception('FAILED!')
+    else:
+        test_results.append(True)
+        print('PASSED!')
+        print('')
+
+
 if __name__ == '__main__':
 
     float_dtype = np.float64
@@ -430,6 +446,145 @@ if __name__ == '__main__':
                 else:
                     break
 
+    print(breakline)
+    print('Testing repeated runs of an example problem...')
+    # every run is given its own child seed and must reuse the compiled solver of the first run
+    starts = []
+    solvers = []
+    for run_seed in np.random.SeedSequence(0).spawn(2):
+        pyipm._example_output([(7, float_dtype, False, Ftol, verbosity, False, run_seed)])
+        solvers.extend(pyipm._solver_cache.values())
+        starts.append((solvers[-1].x0.copy(), solvers[-1].x.copy()))
+    check(len(pyipm._solver_cache) == 1 and solvers[0] is solvers[1] and
+          not np.array_equal(starts[0][0], starts[1][0]) and not np.array_equal(starts[0][1], starts[1][1]) and
+          all(np.linalg.norm(x - 1.0 / 3.0) <= Stol for _, x in starts), test_results)
+
+    print(breakline)
+    print('Testing constraint functions without Jacobians...')
+    # the Jacobians are approximated by forward differences; ce cannot be evaluated on a matrix of points
+    # (the sum runs over all of them) while ci maps each column of such a matrix to its constraint
+    ce = lambda x: np.sum(np.array([-1.0, -1.0, 1.0]) * x) - 1.0
+    ci = lambda x: x[2] - x[0] ** 2
+    d2ce = lambda x, lda: np.zeros((3, 3), dtype=x.dtype)
+    d2ci = lambda x, lda: np.diag([-2.0 * lda[1], 0.0, 0.0]).astype(x.dtype)
+    for lbfgs in hess_type:
+        print('\n'.join(p10['text_statements']))
+        p = IPM(x0=p10['init'], x_dev=x_dev, f=p10['f'], ce=ce, d2ce=None if lbfgs else d2ce, ci=ci,
+                d2ci=None if lbfgs else d2ci, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity)
+        x, s, lda, fval, kkt = p.solve()
+        check(np.linalg.norm(p10['ground_truth'][0] - x) <= Stol, test_results)
+
+    print('Testing the forward difference Jacobian of a function that is only vectorized in appearance...')
+    # evaluated on a matrix of points, the last term is taken from the first point only, so the result
+    # has the right shape and is only correct for the first point
+    ce = lambda x: x[2] - x[1] - np.ravel(x)[0] - 1.0
+    jaco = p.fd_jacobian(ce)
+    x = np.random.randn(3).astype(float_dtype)
+    check(all(np.allclose(jaco(x).ravel(), [-1.0, -1.0, 1.0], atol=Stol) for _ in range(2)), test_results)
+
+    print('Testing that a constraint function requires its Hessian with the exact Hessian...')
+    try:
+        IPM(x0=p10['init'], x_dev=x_dev, f=p10['f'], ce=p10['ce'], ci=ci, Ftol=Ftol, lbfgs=False,
+            float_dtype=float_dtype, verbosity=verbosity).solve()
+        raised = False
+    except ValueError:
+        raised = True
+    check(raised, test_results)
+
+    print(breakline)
+    print('Testing the compile cache...')
+    print('\n'.join(p5['text_statements']))
+    p = IPM(x0=p5['init'], x_dev=x_dev, f=p5['f'], ci=p5['ci'], Ftol=Ftol, lbfgs=hess_type[1],
+            float_dtype=float_dtype, verbosity=verbosity)
+    solutions = [p.solve()[0]]
+    cost = p.cost
+    # a second solve reuses the compiled functions
+    solutions.append(p.solve()[0])
+    check(p.cost is cost and len(p.compile_cache) == 1, test_results)
+    # changing the Hessian type compiles new functions, and changing it back reuses the first ones
+    p.lbfgs = hess_type[0]
+    solutions.append(p.solve()[0])
+    check(p.cost is not cost and len(p.compile_cache) == 2, test_results)
+    p.lbfgs = hess_type[1]
+    solutions.append(p.solve()[0])
+    check(p.cost is cost and len(p.compile_cache) == 2, test_results)
+    # so do a new tolerance and a new expression
+    p.Ktol = 1.0E-5
+    solutions.append(p.solve()[0])
+    check(p.cost is not cost and len(p.compile_cache) == 3, test_results)
+    p.f = p5['f'] + 0.0
+    cost = p.cost
+    solutions.append(p.solve()[0])
+    check(p.cost is not cost and len(p.compile_cache) == 4, test_results)
+    # a forced recompile bypasses the cache
+    cost = p.cost
+    solutions.append(p.solve(force_recompile=True)[0])
+    check(p.cost is not cost and len(p.compile_cache) == 4, test_results)
+    check(all(np.linalg.norm(p5['ground_truth'][0] - x) <= Stol for x in solutions), test_results)
+    # the precision in which the Newton system is solved is part of the compiled configuration
+    p = IPM(x0=p5['init'].astype(np.float32), x_dev=x_dev, f=p5['f'], ci=p5['ci'], Ftol=Ftol,
+            float_dtype=np.float32, mixed_precision=True, verbosity=verbosity)
+    solutions = [p.solve()[0]]
+    cost = p.cost
+    p.mixed_precision = False
+    solutions.append(p.solve()[0])
+    check(p.cost is not cost and p.hess_buf.dtype == np.float32 and len(p.compile_cache) == 2, test_results)
+    check(all(np.linalg.norm(p5['ground_truth'][0] - x) <= Stol for x in solutions), test_results)
+
+    print(breakline)
+    print('Testing 32-bit precision with the Newton systems solved in 64-bit precision (mixed_precision)...')
+    for lbfgs in hess_type:
+        for problem in test_problems:
+            print('\n'.join(problem['text_statements']))
+            solutions = []
+            for dtype, mixed_precision in ((np.float64, False), (np.float32, True)):
+                p = IPM(x0=problem['init'].astype(dtype), x_dev=x_dev, f=problem['f'], ce=problem['ce'],
+                        ci=problem['ci'], Ftol=Ftol, lbfgs=lbfgs, float_dtype=dtype,
+                        mixed_precision=mixed_precision, verbosity=verbosity)
+                solutions.append(p.solve()[0])
+            # rounding may steer the two runs to different solutions of a problem with several of them
+            if len(problem['ground_truth']) > 1:
+                solutions[0] = min(problem['ground_truth'], key=lambda x_gt: np.linalg.norm(x_gt - solutions[1]))
+            check(np.linalg.norm(solutions[1] - solutions[0]) <= Stol, test_results)
+
+    print(breakline)
+    if jax is None:
+        print('Skipping functions built by JAX (JAX is not installed)...')
+    else:
+        print('Testing functions built by JAX...')
+        f = lambda x: (x[0] - 1.0) ** 2 + 2.0 * (x[1] + 2.0) ** 2 + 3.0 * (x[2] + 3.0) ** 2
+        ce = lambda x: x[2] - x[1] - x[0] - 1.0
+        ci = lambda x: x[2] - x[0] ** 2
+        # 64-bit weights are refused while JAX computes in 32-bit precision
+        jax.config.update('jax_enable_x64', False)
+        try:
+            IPM(x0=p10['init'], x_dev=x_dev, Ftol=Ftol, float_dtype=float_dtype, verbosity=verbosity,
+                **IPM.jax_functions(f, ce=ce, ci=ci)).solve()
+            raised = False
+        except ValueError:
+            raised = True
+        check(raised, test_results)
+        jax.config.update('jax_enable_x64', True)
+        for lbfgs in hess_type:
+            print('\n'.join(p10['text_statements']))
+            p = IPM(x0=p10['init'], x_dev=x_dev, Ftol=Ftol, lbfgs=lbfgs, float_dtype=float_dtype, verbosity=verbosity,
+                    **IPM.jax_functions(f, ce=ce, ci=ci, lbfgs=lbfgs))
+            x, s, lda, fval, kkt = p.solve()
+            check(np.linalg.norm(p10['ground_truth'][0] - x) <= Stol, test_results)
+
+    print(breakline)
+    print('Testing the SciPy (trust-constr) solver of the examples...')
+    # the solution and the Lagrange multipliers, in IPM's sign convention, must match those of IPM
+    for problem in (p5, p10):
+        print('\n'.join(problem['text_statements']))
+        x, s, lda, fval, kkt = IPM(x0=problem['init'], x_dev=x_dev, f=problem['f'], ce=problem['ce'], ci=problem['ci'],
+                                   Ftol=Ftol, float_dtype=float_dtype, verbosity=verbosity).solve()
+        x_sp, s_sp, lda_sp, fval_sp, kkt_sp = pyipm._scipy_solve(problem['init'], x_dev, problem['f'], ce=problem['ce'],
+                                                                 ci=problem['ci'], verbosity=verbosity)
+        active = np.abs(lda) > Stol
+        check(np.linalg.norm(x_sp - x) <= Stol and np.allclose(lda_sp, lda, rtol=Stol, atol=Stol) and
+              np.array_equal(np.sign(lda_sp[active]), np.sign(lda[active])), test_results)
+
     if all(test_results):
         print('ALL TESTS PASSED ({} passed, 0 failed)'.format(len(test_results)))
     else: